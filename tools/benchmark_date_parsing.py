@@ -0,0 +1,70 @@
+from lib.date_parser import DateParser
+from lib.transaction import Transaction
+from datetime import datetime, timedelta
+
+import argparse
+import random
+import time
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Measure how many timestamps per second are parsed')
+    parser.add_argument('--rows',
+                        type=int,
+                        default=200000,
+                        help='number of timestamps parsed in each benchmark. default: 200000')
+    parser.add_argument('--repeat',
+                        type=int,
+                        default=3,
+                        help='number of transactions sharing each timestamp, as exchanges write one row per fee, '
+                             'trade leg, etc. default: 3')
+    return parser.parse_args()
+
+
+# how Transaction parsed dates before DateParser
+def parse_with_strptime(date_string):
+    for fmt in Transaction.VALID_DATE_FORMATS:
+        try:
+            return datetime.strptime(date_string, fmt)
+        except ValueError:
+            continue
+    raise Exception("None of the datetime formats were valid")
+
+
+def get_date_strings(rows, repeat, fmt):
+    date = datetime(2015, 1, 1)
+    date_strings = list()
+    while len(date_strings) < rows:
+        date += timedelta(seconds=random.randint(1, 3600))
+        date_strings.extend([date.strftime(fmt)] * repeat)
+    return date_strings[:rows]
+
+
+def benchmark(name, parse, date_strings):
+    start = time.time()
+    for date_string in date_strings:
+        parse(date_string)
+    elapsed = time.time() - start
+    print("%-45s %12.0f rows/sec" % (name, len(date_strings) / elapsed))
+
+
+def run():
+    args = parse_arguments()
+    random.seed(0)
+
+    for fmt in Transaction.VALID_DATE_FORMATS:
+        date_strings = get_date_strings(args.rows, args.repeat, fmt)
+        print("format %r" % fmt)
+        benchmark("  before: strptime per format", parse_with_strptime, date_strings)
+        benchmark("  after: DateParser", DateParser(Transaction.VALID_DATE_FORMATS).parse, date_strings)
+        benchmark("  after: DateParser, no repeated timestamps",
+                  DateParser(Transaction.VALID_DATE_FORMATS).parse, get_date_strings(args.rows, 1, fmt))
+
+    date_strings = get_date_strings(args.rows, args.repeat, Transaction.VALID_DATE_FORMATS[0])
+    benchmark("Transaction construction",
+              lambda date_string: Transaction(date_string, "trade", "btc", "1.0", "1000.0"),
+              date_strings)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,169 @@
+from lib.lot_compaction import LotCompactor
+from lib.lot_selection import LOT_SELECTORS, get_lot_selector_factory
+from lib.tax_report import TaxReport
+from lib.transaction import Transaction
+from datetime import datetime, timedelta
+
+import argparse
+import collections
+import random
+import time
+
+# relative difference up to which totals with and without lot compaction count as the same
+TOTALS_TOLERANCE = 1e-9
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Measure lot selection throughput of every algorithm')
+    parser.add_argument('--lots',
+                        type=int,
+                        default=200000,
+                        help='number of lots bought before they are all sold. default: 200000')
+    parser.add_argument('--transactions',
+                        type=int,
+                        default=200000,
+                        help='number of transactions in the tax report benchmark. default: 200000')
+    parser.add_argument('--dca_transactions',
+                        type=int,
+                        default=100000,
+                        help='number of transactions in the lot compaction benchmark. default: 100000')
+    return parser.parse_args()
+
+
+def get_transactions(count, sell_ratio):
+    random.seed(0)
+    date = datetime(2015, 1, 1)
+    held = 0.0
+    transactions = list()
+    for _ in xrange(count):
+        date += timedelta(minutes=random.randint(1, 60))
+        value = random.uniform(100, 20000)
+        if held > 1 and random.random() < sell_ratio:
+            amount = -random.uniform(0.1, min(held, 3))
+        else:
+            amount = random.uniform(0.1, 1)
+        held += amount
+        transactions.append(Transaction(date, "trade", "btc", amount, value))
+    return transactions
+
+
+# many small buys at one price per day, as a recurring purchase plan fills them, and a sale now and then
+def get_dca_transactions(count):
+    random.seed(2)
+    date = datetime(2015, 1, 1)
+    price = 1000.0
+    held = 0.0
+    transactions = list()
+    for _ in xrange(count):
+        day = date.date()
+        date += timedelta(minutes=random.randint(1, 15))
+        if date.date() != day:
+            price = round(price * random.uniform(0.95, 1.05), 2)
+        if held > 1 and random.random() < 0.005:
+            amount = -random.uniform(0.1, min(held, 0.5))
+        else:
+            amount = random.uniform(0.001, 0.01)
+        held += amount
+        transactions.append(Transaction(date, "trade", "btc", amount, price))
+    return transactions
+
+
+def get_designations(lots):
+    # sell every lot in a random order
+    designations = collections.defaultdict(list)
+    for lot in random.sample(lots, len(lots)):
+        designations[(None, "btc")].append(lot.date)
+    return designations
+
+
+def get_sale_designations(transactions):
+    # designate lots bought before each sale, chosen at random from the ones not sold yet, until they cover the amount
+    # sold, so sales are matched by designation rather than by the oldest lot fallback
+    random.seed(1)
+    designations = collections.defaultdict(list)
+    lots = list()
+    for transaction in transactions:
+        if transaction.amount > 0:
+            lots.append((transaction.date, transaction.amount))
+            continue
+        designated = 0
+        while lots and designated < -transaction.amount:
+            index = random.randrange(len(lots))
+            lots[index], lots[-1] = lots[-1], lots[index]
+            lot_date, amount = lots.pop()
+            designations[(transaction.date, transaction.currency)].append(lot_date)
+            designated += amount
+        # the rest of a partly sold lot can be designated again
+        if designated > -transaction.amount:
+            lots.append((lot_date, designated + transaction.amount))
+    return designations
+
+
+def benchmark_lot_selector(algorithm, lots):
+    designations = get_designations(lots) if algorithm == "SPECID" else None
+    lot_selector = get_lot_selector_factory(algorithm, designations)()
+    sale = Transaction(None, "trade", "btc", -1)
+
+    start = time.time()
+    for lot in lots:
+        lot_selector.push(lot)
+    for _ in xrange(len(lots)):
+        lot_selector.pop(sale)
+    elapsed = time.time() - start
+    return 2 * len(lots) / elapsed
+
+
+def benchmark_tax_report(algorithm, transactions):
+    designations = get_sale_designations(transactions) if algorithm == "SPECID" else None
+
+    start = time.time()
+    TaxReport(transactions, algorithm, designations).process_transactions(show_progress=False)
+    elapsed = time.time() - start
+    return len(transactions) / elapsed
+
+
+# rows/sec and open lots at the end without and with lot compaction, and whether the totals are the same. Merged lots
+# are summed in a different order, so totals only agree up to float rounding, see TOTALS_TOLERANCE
+def benchmark_lot_compaction(algorithm, transactions):
+    results = list()
+    for lot_compactor in (None, LotCompactor()):
+        tax_report = TaxReport(transactions, algorithm)
+        tax_report.lot_compactor = lot_compactor
+
+        start = time.time()
+        tax_report.process_transactions(show_progress=False)
+        elapsed = time.time() - start
+        results.append((len(transactions) / elapsed, len(tax_report.get_remaining_transactions()),
+                        tax_report.get_totals()))
+
+    (rows_per_second, lots, totals), (compacted_rows_per_second, compacted_lots, compacted_totals) = results
+    same_totals = all(abs(total - compacted_total) <= TOTALS_TOLERANCE * max(abs(total), abs(compacted_total), 1)
+                      for total, compacted_total in zip(totals, compacted_totals))
+    return rows_per_second, compacted_rows_per_second, lots, compacted_lots, same_totals
+
+
+def run():
+    args = parse_arguments()
+    lots = get_transactions(args.lots, 0)
+    transactions = get_transactions(args.transactions, 0.4)
+
+    print("%-8s %22s %24s" % ("", "push+pop ops/sec", "tax report rows/sec"))
+    for algorithm in sorted(set(LOT_SELECTORS) - {"FIHO"}):
+        print("%-8s %22.0f %24.0f" % (algorithm,
+                                      benchmark_lot_selector(algorithm, lots),
+                                      benchmark_tax_report(algorithm, transactions)))
+
+    dca_transactions = get_dca_transactions(args.dca_transactions)
+    print("")
+    print("%-8s %14s %20s %10s %16s %12s" % ("", "rows/sec", "compacted rows/sec", "open lots", "compacted lots",
+                                              "same totals"))
+    # SPECID lots are designated by their purchase date and cannot be compacted
+    for algorithm in ["FIFO", "HIFO", "LIFO"]:
+        rows_per_second, compacted_rows_per_second, lots, compacted_lots, same_totals = \
+            benchmark_lot_compaction(algorithm, dca_transactions)
+        print("%-8s %14.0f %20.0f %10d %16d %12s" % (algorithm, rows_per_second, compacted_rows_per_second, lots,
+                                                      compacted_lots, "yes" if same_totals else "no"))
+
+
+if __name__ == '__main__':
+    run()
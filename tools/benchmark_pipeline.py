@@ -0,0 +1,150 @@
+from lib import synthetic_data
+from lib.binary_format import FILE_FORMATS, open_transaction_file, write_transactions
+from lib.exchange_converter import EXCHANGE_CONVERTERS, convert_file
+from lib.tax_report import TaxReport
+from lib.transaction_merge import merge_transaction_files
+from lib.value_adapter import ValueAdapter
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Measure the throughput of converting, consolidating and reporting '
+                                                 'synthetic exchange exports')
+    parser.add_argument('--rows',
+                        type=int,
+                        default=100000,
+                        help='number of rows in each synthetic exchange export, 10000 to 10000000. default: 100000')
+    parser.add_argument('--exchanges',
+                        nargs="+",
+                        default=sorted(EXCHANGE_CONVERTERS),
+                        choices=sorted(EXCHANGE_CONVERTERS),
+                        help='exchanges to generate exports for. default: all of them')
+    parser.add_argument('--algorithm',
+                        default="HIFO",
+                        help='lot selection algorithm of the tax report. default: HIFO')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='seed of the synthetic data, keep it fixed to compare commits. default: 0')
+    parser.add_argument('--work_dir',
+                        help='directory for the generated files. default: a temporary directory that is removed')
+    parser.add_argument('--file_format',
+                        choices=FILE_FORMATS,
+                        default="csv",
+                        help='format of the files handed from one stage to the next. default: csv')
+    parser.add_argument('--json_file',
+                        help='path to save the results to as json')
+    return parser.parse_args()
+
+
+class StubCoinbaseClient:
+    """
+    Answers every price lookup offline with a made up price that only depends on the currency and date.
+    """
+    def get_historic_price(self, currency, date):
+        return "%.2f" % (100 + sum(ord(c) * (i + 1) for i, c in enumerate(currency + date)) % 10000)
+
+
+# returns the number of exchange rows read, which is what conversion throughput is measured against
+def convert(exchange, input_file, export_file, rows, file_format):
+    transactions = convert_file(input_file, exchange)
+    ValueAdapter(coinbase_client=StubCoinbaseClient()).set_transaction_values(transactions)
+    write_transactions(transactions, export_file, file_format)
+    return rows
+
+
+def consolidate(input_files, export_file, file_format):
+    count = [0]
+
+    def count_transactions(transactions):
+        for transaction in transactions:
+            count[0] += 1
+            yield transaction
+
+    write_transactions(count_transactions(merge_transaction_files(input_files)), export_file, file_format)
+    return count[0]
+
+
+def generate_tax_report(input_file, export_file, algorithm):
+    tax_report = TaxReport(open_transaction_file(input_file), algorithm)
+    rows = tax_report.process_transactions(show_progress=False)
+    tax_report.write_tax_report(export_file)
+    return rows
+
+
+# runs in a child process so every stage starts from a fresh interpreter and reports its own peak memory
+def measure_stage(queue, stage, args):
+    try:
+        start = time.time()
+        rows = stage(*args)
+        elapsed = time.time() - start
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # linux reports kilobytes, mac reports bytes
+        peak_memory_mb = peak_memory / (1024.0 * 1024.0) if sys.platform == "darwin" else peak_memory / 1024.0
+        queue.put((rows, elapsed, peak_memory_mb))
+    except Exception:
+        queue.put(traceback.format_exc())
+
+
+def run_stage(name, stage, *args):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure_stage, args=(queue, stage, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    if isinstance(result, str):
+        raise Exception("%s failed:\n%s" % (name, result))
+
+    rows, elapsed, peak_memory_mb = result
+    rows_per_second = rows / elapsed if elapsed else 0
+    print("%-28s %10d %10.2f %14.0f %12.1f" % (name, rows, elapsed, rows_per_second, peak_memory_mb))
+    return {"stage": name, "rows": rows, "seconds": elapsed, "rows_per_second": rows_per_second,
+            "peak_memory_mb": peak_memory_mb}
+
+
+def run():
+    args = parse_arguments()
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="crypto_taxes_benchmark_")
+    if not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+
+    try:
+        print("%-28s %10s %10s %14s %12s" % ("stage", "rows", "seconds", "rows/sec", "peak MB"))
+        results = list()
+
+        standard_files = [os.path.join(work_dir, "opening_balances.csv")]
+        synthetic_data.write_opening_balances(standard_files[0])
+        for exchange in args.exchanges:
+            export_file = os.path.join(work_dir, "%s_export.csv" % exchange)
+            synthetic_data.EXPORT_WRITERS[exchange](export_file, args.rows, args.seed)
+
+            standard_files.append(os.path.join(work_dir, "%s_standard.%s" % (exchange, args.file_format)))
+            results.append(run_stage("convert %s" % exchange, convert, exchange, export_file, standard_files[-1],
+                                     args.rows, args.file_format))
+
+        consolidated_file = os.path.join(work_dir, "consolidated.%s" % args.file_format)
+        results.append(run_stage("consolidate", consolidate, standard_files, consolidated_file, args.file_format))
+        results.append(run_stage("tax report %s" % args.algorithm, generate_tax_report, consolidated_file,
+                                 os.path.join(work_dir, "tax_report.csv"), args.algorithm))
+
+        if args.json_file:
+            with open(args.json_file, 'w') as json_file:
+                json.dump({"rows": args.rows, "seed": args.seed, "algorithm": args.algorithm,
+                           "file_format": args.file_format, "stages": results},
+                          json_file, indent=2)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    run()
@@ -1,4 +1,8 @@
-from lib.transaction import write_transactions_to_file, get_transactions_from_file
+from lib.binary_format import FILE_FORMATS, read_transaction_table, write_transactions
+from lib.transaction_table import TransactionTable
+from lib.transaction_merge import merge_transaction_files, DEFAULT_CHUNK_SIZE
+from lib import metrics
+from lib.metrics import ProgressReporter
 
 import argparse
 
@@ -12,19 +16,65 @@ def parse_arguments():
     parser.add_argument('--export_file',
                         default='consolidated_standard_exchange.csv',
                         help='name of the file where consolidated standard exchange data will be saved')
+    parser.add_argument('--streaming',
+                        action='store_true',
+                        help='merge the input files one transaction at a time instead of loading them all into memory')
+    parser.add_argument('--chunk_size',
+                        type=int,
+                        default=DEFAULT_CHUNK_SIZE,
+                        help='number of transactions sorted in memory at once when streaming input files that are not '
+                             'ordered by date. default: %d' % DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--assume_sorted',
+                        action='store_true',
+                        help='skip checking that streamed input files are ordered by date')
+    parser.add_argument('--export_format',
+                        choices=FILE_FORMATS,
+                        default='csv',
+                        help='csv, or binary to hand the result to generate_tax_report without parsing it again. '
+                             'Input files can be either. default: csv')
+    metrics.add_arguments(parser)
     return parser.parse_args()
 
 
 def run():
     args = parse_arguments()
+    metrics.run_instrumented("consolidate_standard_transactions", args,
+                             lambda run_metrics: consolidate(args, run_metrics))
 
-    transactions = list()
-    for input_file in args.input_files:
-        transactions.extend(get_transactions_from_file(input_file))
 
-    transactions.sort(key=lambda x: x.date)
+def consolidate(args, run_metrics):
+    if args.streaming:
+        # reading, merging and writing are interleaved, so streaming is measured as one stage
+        with run_metrics.stage("merge and write") as stage:
+            stage.rows = count_transactions_written(
+                merge_transaction_files(args.input_files, args.chunk_size, args.assume_sorted), args.export_file,
+                args.export_format)
+        return
 
-    write_transactions_to_file(transactions, args.export_file)
+    transactions = TransactionTable()
+    with run_metrics.stage("read") as stage:
+        for input_file in args.input_files:
+            transactions.extend_table(read_transaction_table(input_file))
+        stage.rows = len(transactions)
+    with run_metrics.stage("sort", len(transactions)):
+        transactions.sort_by_date()
+    with run_metrics.stage("write", len(transactions)):
+        write_transactions(transactions, args.export_file, args.export_format)
+
+
+def count_transactions_written(transactions, export_file, export_format):
+    progress = ProgressReporter("Transactions written")
+    count = [0]
+
+    def count_transactions():
+        for transaction in transactions:
+            count[0] += 1
+            progress.update(count[0])
+            yield transaction
+
+    write_transactions(count_transactions(), export_file, export_format)
+    progress.finish(count[0])
+    return count[0]
 
 
 if __name__ == '__main__':
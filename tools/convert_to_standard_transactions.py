@@ -1,59 +1,155 @@
-from lib.exchange_converter import \
-    GeminiExchangeConverter, \
-    GdaxExchangeConverter, \
-    CoinbaseExchangeConverter, \
-    BinanceExchangeConverter
-from lib.transaction import write_transactions_to_file
-from lib import coinbase_api
+from lib.exchange_converter import EXCHANGE_CONVERTERS, DEFAULT_CHUNK_BYTES, convert_files, detect_exchange
+from lib.binary_format import FILE_FORMATS, write_transactions
+from lib.coinbase_api import CoinbaseClient
+from lib.price_providers import CoinbasePriceProvider, CoinMarketCapPriceProvider, PriceFileProvider
+from lib.price_cache import PriceCache
+from lib.price_series import PriceSeries
 from lib.value_adapter import ValueAdapter
+from lib import metrics
 
 import argparse
-import csv
+import glob
+import os
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Convert all exchange data into a standard format')
     parser.add_argument('--exchange',
-                        required=True,
-                        help='Name of exchange whose data you are inputting. i.e. Gemini, Gdax, or Coinbase')
-    parser.add_argument('--input_file',
-                        required=True,
+                        type=str.lower,
+                        choices=sorted(EXCHANGE_CONVERTERS),
+                        help='Name of exchange whose data you are inputting. i.e. Gemini, Gdax, Coinbase or Binance. '
+                             'default: detected from the header of each input file')
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument('--input_file',
                         help="path to trade data")
+    inputs.add_argument('--input_dir',
+                        help="directory of exports to convert, every csv file in it is converted in parallel")
     parser.add_argument('--export_file',
                         default='standard_transactions.csv',
                         help='name of the file where data will be saved. default: standard_transactions.csv')
-    return parser.parse_args()
+    parser.add_argument('--export_dir',
+                        default='standard_transactions',
+                        help='directory the files converted from --input_dir are saved to, each named after its '
+                             'export. default: standard_transactions')
+    parser.add_argument('--processes',
+                        type=int,
+                        help='number of processes converting the input. default: number of CPUs')
+    parser.add_argument('--chunk_megabytes',
+                        type=float,
+                        default=DEFAULT_CHUNK_BYTES / (1024 * 1024),
+                        help='size of the pieces exports are split into so one large export is converted by every '
+                             'process. default: %d' % (DEFAULT_CHUNK_BYTES / (1024 * 1024)))
+    parser.add_argument('--price_cache',
+                        default='price_cache.db',
+                        help='path to the file where looked up prices are kept between runs. default: price_cache.db')
+    parser.add_argument('--prefetch_workers',
+                        type=int,
+                        default=ValueAdapter.DEFAULT_PREFETCH_WORKERS,
+                        help='number of prices looked up concurrently. default: %d' %
+                             ValueAdapter.DEFAULT_PREFETCH_WORKERS)
+    parser.add_argument('--requests_per_second',
+                        type=float,
+                        default=10,
+                        help='maximum number of price requests sent per second. default: 10')
+    parser.add_argument('--skip_cross_rates',
+                        action='store_true',
+                        help='look up both sides of pair trades instead of valuing one side from the other')
+    parser.add_argument('--price_file',
+                        help='csv of date (yyyy-mm-dd), currency, price rows with a header row, used before any '
+                             'price is downloaded')
+    parser.add_argument('--offline',
+                        action='store_true',
+                        help='only use --price_cache and --price_file, prices they do not have are left empty')
+    parser.add_argument('--price_series',
+                        action='store_true',
+                        help='download the daily prices of every currency in one request per currency from '
+                             'CoinMarketCap before looking up single days. Requires numpy')
+    parser.add_argument('--fill_missing_days',
+                        choices=PriceSeries.FILL_METHODS,
+                        default='none',
+                        help='how days missing from a price series are filled. default: none')
+    parser.add_argument('--export_format',
+                        choices=FILE_FORMATS,
+                        default='csv',
+                        help='csv, or binary to hand the result to the other tools without parsing it again. '
+                             'default: csv')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    if args.offline and args.price_series:
+        parser.error("--price_series downloads prices and cannot be used --offline")
+    return args
 
 
 def run():
     args = parse_arguments()
+    metrics.run_instrumented("convert_to_standard_transactions", args, lambda run_metrics: convert(args, run_metrics))
 
-    # initialize variables
-    transactions = list()
+
+def convert(args, run_metrics):
+    input_files, export_files = get_input_and_export_files(args)
 
     # standard data format:
     # date, currency, transaction type(buy, sell, deposit, withdraw, fee)
-    with open(args.input_file, 'rb') as csv_file:
-        csv_reader_data = csv.reader(csv_file)
-
-        if args.exchange.lower() == "gdax":
-            exchange_converter = GdaxExchangeConverter(csv_reader_data)
-        elif args.exchange.lower() == "gemini":
-            exchange_converter = GeminiExchangeConverter(csv_reader_data)
-        elif args.exchange.lower() == "coinbase":
-            exchange_converter = CoinbaseExchangeConverter(csv_reader_data)
-        elif args.exchange.lower() == "binance":
-            exchange_converter = BinanceExchangeConverter(csv_reader_data)
-        else:
-            raise Exception("%s is not a valid exchange" % args.exchange)
+    with run_metrics.stage("convert") as stage:
+        transaction_tables = convert_files(input_files, args.exchange, args.processes,
+                                           int(args.chunk_megabytes * 1024 * 1024))
+        stage.rows = sum(len(transactions) for transactions in transaction_tables)
+
+    price_cache = PriceCache(args.price_cache)
+    value_adapter = ValueAdapter(price_cache,
+                                 cross_rates=not args.skip_cross_rates,
+                                 price_providers=get_price_providers(args))
+    # prices are looked up in this process so every file shares one price cache. The prices found are committed even
+    # when a lookup fails
+    try:
+        with run_metrics.stage("value", stage.rows):
+            for transactions in transaction_tables:
+                value_adapter.set_transaction_values(transactions, args.prefetch_workers)
+    finally:
+        price_cache.close()
+    for name, value in value_adapter.get_metrics().items():
+        run_metrics.set(name, value)
+
+    with run_metrics.stage("write", stage.rows):
+        for transactions, export_file in zip(transaction_tables, export_files):
+            write_transactions(transactions, export_file, args.export_format)
+    run_metrics.set("files", len(input_files))
+
 
-        transactions = exchange_converter.get_standard_transactions()
+# cheapest first: the local price file, then one CoinMarketCap download per currency, then a coinbase request per day
+def get_price_providers(args):
+    price_providers = list()
+    if args.price_file:
+        price_providers.append(PriceFileProvider(args.price_file))
+    if args.offline:
+        return price_providers
 
-    value_adapter = ValueAdapter()
-    for transaction in transactions:
-        value_adapter.set_transaction_value(transaction)
+    if args.price_series:
+        price_providers.append(CoinMarketCapPriceProvider(args.fill_missing_days))
+    price_providers.append(CoinbasePriceProvider(CoinbaseClient(pool_size=args.prefetch_workers,
+                                                                requests_per_second=args.requests_per_second)))
+    return price_providers
+
+
+# files of --input_dir that are not a known export are skipped, the output of a file is named after it
+def get_input_and_export_files(args):
+    if args.input_file:
+        return [args.input_file], [args.export_file]
+
+    input_files = list()
+    for input_file in sorted(glob.glob(os.path.join(args.input_dir, "*.csv"))):
+        if args.exchange is None and detect_exchange(input_file) is None:
+            print "Skipping %s, it is not an export of a supported exchange" % input_file
+        else:
+            input_files.append(input_file)
 
-    write_transactions_to_file(transactions, args.export_file)
+    if not os.path.isdir(args.export_dir):
+        os.makedirs(args.export_dir)
+    extension = ".bin" if args.export_format == "binary" else ".csv"
+    export_files = [os.path.join(args.export_dir,
+                                 os.path.splitext(os.path.basename(input_file))[0] + "_standard" + extension)
+                    for input_file in input_files]
+    return input_files, export_files
 
 
 if __name__ == '__main__':
@@ -0,0 +1,67 @@
+from lib.coin_market_cap_api import DEFAULT_DOWNLOAD_WORKERS, download_daily_prices, store_daily_prices
+from lib.price_cache import PriceCache
+
+import argparse
+import csv
+import datetime
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Download daily USD prices of many currencies from CoinMarketCap')
+    parser.add_argument('--currencies',
+                        nargs='+',
+                        required=True,
+                        help="space delimited list of currency symbols, i.e. btc eth bnb")
+    parser.add_argument('--start_date',
+                        type=parse_date,
+                        required=True,
+                        help="first day to download, yyyy-mm-dd")
+    parser.add_argument('--end_date',
+                        type=parse_date,
+                        default=datetime.date.today(),
+                        help="last day to download, yyyy-mm-dd. default: today")
+    parser.add_argument('--price_cache',
+                        default='price_cache.db',
+                        help='path to the price cache the prices are saved in. default: price_cache.db')
+    parser.add_argument('--price_file',
+                        help='path to also save the prices to as a Date,Currency,Price csv, usable as the '
+                             '--price_file of convert_to_standard_transactions.py')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=DEFAULT_DOWNLOAD_WORKERS,
+                        help='number of currencies downloaded concurrently. default: %d' % DEFAULT_DOWNLOAD_WORKERS)
+    return parser.parse_args()
+
+
+def parse_date(date):
+    return datetime.datetime.strptime(date, "%Y-%m-%d").date()
+
+
+def run():
+    args = parse_arguments()
+    currencies = [currency.lower() for currency in args.currencies]
+    daily_prices = download_daily_prices(currencies, args.start_date, args.end_date, args.workers)
+
+    price_cache = PriceCache(args.price_cache)
+    for currency in sorted(daily_prices):
+        store_daily_prices(price_cache, currency, daily_prices[currency])
+    price_cache.close()
+
+    if args.price_file:
+        write_price_file(daily_prices, args.price_file)
+
+    for currency in currencies:
+        print("%s: %d days" % (currency, len(daily_prices.get(currency, []))))
+
+
+def write_price_file(daily_prices, file_name):
+    with open(file_name, 'wb') as price_file:
+        price_file_writer = csv.writer(price_file)
+        price_file_writer.writerow(["Date", "Currency", "Price"])
+        for currency in sorted(daily_prices):
+            for date, price in sorted(daily_prices[currency]):
+                price_file_writer.writerow([date.strftime("%Y-%m-%d"), currency, repr(price)])
+
+
+if __name__ == '__main__':
+    run()
@@ -1,5 +1,11 @@
-from lib.transaction import Transaction, get_transactions_from_file
-from lib.tax_report import TaxReport
+from lib.binary_format import open_transaction_file
+from lib.holdings_index import HoldingsIndexWriter
+from lib.fixed_point import to_units
+from lib.lot_compaction import LotCompactor
+from lib.tax_report import ScenarioReport, TaxReport
+from lib.lot_selection import LOT_SELECTORS, read_lot_designations
+from lib.report_state import DEFAULT_CHECKPOINT_INTERVAL, ReportStateFile, get_configuration
+from lib import metrics
 
 import argparse
 
@@ -13,17 +19,164 @@ def parse_arguments():
                         default='tax_returns.csv',
                         help='name of the file where all data will be stored')
     parser.add_argument('--algorithm',
-                        default="FIHO",
-                        help="Choose the selection algorithm. Default is FIHO.")
-    return parser.parse_args()
+                        default="HIFO",
+                        type=str.upper,
+                        choices=sorted(LOT_SELECTORS),
+                        help="Choose which lots are sold first: FIFO, LIFO, HIFO (highest cost, also called FIHO) or "
+                             "SPECID (lots named in --lot_designations). Default is HIFO.")
+    parser.add_argument('--lot_designations',
+                        help="csv of date, currency, lot date rows naming the purchase sold by each sale. "
+                             "Required by SPECID")
+    parser.add_argument('--resume_from',
+                        help="checkpoint saved by last year's report with --save_checkpoint. Its open lots are "
+                             "used instead of prepending last year's remaining purchases to the input file")
+    parser.add_argument('--save_checkpoint',
+                        help="path to save the open lots to for next year's --resume_from")
+    parser.add_argument('--processes',
+                        type=int,
+                        default=1,
+                        help="number of processes matching lots. Each currency is matched in one process, so "
+                             "portfolios with many currencies scale with more processes. Default is 1.")
+    parser.add_argument('--disposals_file',
+                        help="path to save every matched purchase and sale or fee to, one row per match")
+    parser.add_argument('--form_8949_file',
+                        help="path to save one row per lot sold to, laid out like IRS form 8949")
+    parser.add_argument('--holdings_index',
+                        help="path to save every change to the open lots to, so the holdings at any date can be "
+                             "looked up with query_holdings.py")
+    parser.add_argument('--state_file',
+                        help="sidecar file to save the report's state to every --state_interval transactions. When it "
+                             "is given again only the transactions from the first one that changed are matched")
+    parser.add_argument('--state_interval',
+                        type=int,
+                        default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help="number of transactions between the states saved to --state_file. Default is %d." %
+                             DEFAULT_CHECKPOINT_INTERVAL)
+    parser.add_argument('--compact_lots',
+                        action='store_true',
+                        help="merge open lots acquired on the same day at the same unit cost that are sold one after "
+                             "the other, which keeps the number of open lots small for many small purchases")
+    parser.add_argument('--dust_threshold',
+                        type=float,
+                        default=0,
+                        help="with --compact_lots, also fold open lots smaller than this amount into the lot sold "
+                             "after them. Default is 0, never.")
+    parser.add_argument('--compaction_log',
+                        help="with --compact_lots, path to save every merged lot to")
+    parser.add_argument('--compare_algorithms',
+                        nargs='+',
+                        type=str.upper,
+                        choices=sorted(LOT_SELECTORS),
+                        help="space delimited list of algorithms to match the transactions with in a single pass. "
+                             "--export_file gets one row of gains and fees per algorithm instead of the tax report")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    algorithms = args.compare_algorithms or [args.algorithm]
+    if "SPECID" in algorithms and not args.lot_designations:
+        parser.error("--algorithm SPECID requires --lot_designations")
+    if args.compare_algorithms:
+        for option in ["save_checkpoint", "disposals_file", "form_8949_file", "holdings_index"]:
+            if getattr(args, option):
+                parser.error("--%s cannot be used with --compare_algorithms" % option)
+        if args.processes > 1:
+            parser.error("--compare_algorithms matches in a single process")
+    if args.holdings_index and args.processes > 1:
+        parser.error("--holdings_index records the lots of a single process")
+    if args.compact_lots:
+        if "SPECID" in algorithms:
+            parser.error("SPECID lots are designated by their purchase date and cannot be compacted")
+        for option in ["compare_algorithms", "state_file"]:
+            if getattr(args, option):
+                parser.error("--%s cannot be used with --compact_lots" % option)
+        if args.processes > 1:
+            parser.error("--compact_lots compacts the lots of a single process")
+    elif args.dust_threshold or args.compaction_log:
+        parser.error("--dust_threshold and --compaction_log require --compact_lots")
+    if args.state_file:
+        for option in ["compare_algorithms", "holdings_index", "disposals_file", "form_8949_file"]:
+            if getattr(args, option):
+                parser.error("--%s cannot be used with --state_file" % option)
+        if args.processes > 1:
+            parser.error("--state_file saves the state of a single process")
+    return args
 
 
 def run():
     args = parse_arguments()
-    transactions = get_transactions_from_file(args.input_file)
+    if args.compare_algorithms:
+        metrics.run_instrumented("generate_tax_report", args, lambda run_metrics: compare(args, run_metrics))
+    else:
+        metrics.run_instrumented("generate_tax_report", args, lambda run_metrics: generate(args, run_metrics))
 
-    tax_report = TaxReport(transactions, args.algorithm)
-    tax_report.generate_tax_report(args.export_file)
+
+def generate(args, run_metrics):
+    transactions = open_transaction_file(args.input_file)
+
+    lot_designations = read_lot_designations(args.lot_designations) if args.lot_designations else None
+
+    tax_report = TaxReport(transactions, args.algorithm, lot_designations)
+    if args.holdings_index:
+        tax_report.holdings_index = HoldingsIndexWriter(args.holdings_index)
+    if args.compact_lots:
+        tax_report.lot_compactor = LotCompactor(to_units(args.dust_threshold), args.compaction_log)
+    if args.resume_from:
+        with run_metrics.stage("load checkpoint"):
+            tax_report.load_checkpoint(args.resume_from)
+            tax_report.reset_totals()
+
+    with run_metrics.stage("match lots") as stage:
+        if args.processes > 1:
+            stage.rows = tax_report.process_transactions_in_parallel(args.processes)
+        elif args.state_file:
+            state_file = ReportStateFile(args.state_file,
+                                         get_configuration(args.algorithm, args.lot_designations, args.resume_from))
+            stage.rows = tax_report.process_transactions_incrementally(state_file, args.state_interval)
+            state_file.close()
+            run_metrics.set("resumed_from", tax_report.resumed_from)
+        else:
+            stage.rows = tax_report.process_transactions()
+    if tax_report.holdings_index is not None:
+        with run_metrics.stage("write holdings index", tax_report.holdings_index.sequence):
+            tax_report.holdings_index.close()
+    with run_metrics.stage("write report"):
+        tax_report.write_tax_report(args.export_file)
+
+    if args.save_checkpoint:
+        with run_metrics.stage("save checkpoint"):
+            tax_report.save_checkpoint(args.save_checkpoint)
+    if args.disposals_file:
+        with run_metrics.stage("write disposals", len(tax_report.disposals)):
+            tax_report.disposals.write_to_file(args.disposals_file)
+    if args.form_8949_file:
+        with run_metrics.stage("write form 8949", len(tax_report.disposals)):
+            tax_report.disposals.write_form_8949(args.form_8949_file)
+
+    for name, value in tax_report.get_metrics().items():
+        run_metrics.set(name, value)
+    if tax_report.lot_compactor is not None:
+        tax_report.lot_compactor.close()
+        run_metrics.set("lot_compaction", tax_report.lot_compactor.get_metrics())
+
+
+def compare(args, run_metrics):
+    transactions = open_transaction_file(args.input_file)
+
+    lot_designations = read_lot_designations(args.lot_designations) if args.lot_designations else None
+
+    scenario_report = ScenarioReport(transactions, args.compare_algorithms, lot_designations)
+    if args.resume_from:
+        with run_metrics.stage("load checkpoint"):
+            scenario_report.load_checkpoint(args.resume_from)
+            scenario_report.reset_totals()
+
+    with run_metrics.stage("match lots") as stage:
+        stage.rows = scenario_report.process_transactions()
+    with run_metrics.stage("write comparison"):
+        scenario_report.write_comparison(args.export_file)
+    scenario_report.print_comparison()
+
+    for name, value in scenario_report.get_metrics().items():
+        run_metrics.set(name, value)
 
 
 if __name__ == '__main__':
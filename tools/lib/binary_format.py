@@ -0,0 +1,177 @@
+"""
+Binary standard transaction files, read back without parsing dates or numbers.
+
+Layout, little-endian:
+  magic, version
+  blocks of at most BLOCK_ROWS transactions until the end of the file
+Each block is its row count and currency count, the currency names, then the TransactionTable columns one after
+another: epoch seconds, amounts in base units (see fixed_point), values (NaN when unknown), currency codes into the
+block's names and transaction type codes.
+
+Files are memory mapped and read a block at a time, so only one block is held in memory while streaming. Every file
+starts with MAGIC, which is how open_transaction_file tells binary files from csv files.
+"""
+
+from array import array
+from datetime import timedelta
+from fixed_point import UNITS_TYPECODE
+from transaction import Transaction, TransactionFileReader, write_transactions_to_file
+from transaction_table import EPOCH, TransactionTable
+
+import itertools
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = "CTXSTD\0\0"
+VERSION = 2
+HEADER = struct.Struct("<8sH")
+BLOCK_HEADER = struct.Struct("<II")
+NAME_LENGTH = struct.Struct("<B")
+BLOCK_ROWS = 65536
+# array typecode of each TransactionTable column and the struct format it is stored as
+COLUMN_FORMATS = [('l', 'q'), (UNITS_TYPECODE, 'q'), ('d', 'd'), ('H', 'H'), ('B', 'B')]
+FILE_FORMATS = ["csv", "binary"]
+FLOAT_TYPECODES = "fd"
+
+
+def is_binary_transaction_file(file_name):
+    with open(file_name, 'rb') as transaction_file:
+        return transaction_file.read(len(MAGIC)) == MAGIC
+
+
+# returns a re-iterable reader of either format, see TransactionFileReader
+def open_transaction_file(file_name):
+    if is_binary_transaction_file(file_name):
+        return BinaryTransactionFileReader(file_name)
+    return TransactionFileReader(file_name)
+
+
+def read_transaction_table(file_name):
+    if not is_binary_transaction_file(file_name):
+        return TransactionTable.from_transactions(TransactionFileReader(file_name))
+
+    transactions = TransactionTable()
+    for block, _ in iter_blocks(file_name):
+        transactions.extend_table(block)
+    return transactions
+
+
+def write_transactions(transactions, file_name, file_format="csv"):
+    if file_format == "binary":
+        write_binary_transactions(transactions, file_name)
+    elif file_format == "csv":
+        write_transactions_to_file(transactions, file_name)
+    else:
+        raise Exception("%s is not a valid file format" % file_format)
+
+
+def write_binary_transactions(transactions, file_name):
+    with open(file_name, 'wb') as transaction_file:
+        transaction_file.write(HEADER.pack(MAGIC, VERSION))
+        transactions = iter(transactions)
+        while True:
+            block = TransactionTable.from_transactions(itertools.islice(transactions, BLOCK_ROWS))
+            if not len(block):
+                return
+            write_block(transaction_file, block)
+
+
+def write_block(transaction_file, block):
+    transaction_file.write(BLOCK_HEADER.pack(len(block), len(block.currencies)))
+    for currency in block.currencies:
+        transaction_file.write(NAME_LENGTH.pack(len(currency)))
+        transaction_file.write(currency)
+    for column, (_, stored_format) in zip(block.get_columns(), COLUMN_FORMATS):
+        transaction_file.write(column_to_bytes(column, stored_format))
+
+
+# yields every block as a TransactionTable with the offset the block ends at
+def iter_blocks(file_name):
+    with open(file_name, 'rb') as transaction_file:
+        data = mmap.mmap(transaction_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic, version = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise Exception("%s is not a binary transaction file" % file_name)
+        if version != VERSION:
+            raise Exception("%s is a version %d transaction file, only version %d is supported" %
+                            (file_name, version, VERSION))
+
+        offset = HEADER.size
+        while offset < len(data):
+            block, offset = read_block(data, offset)
+            yield block, offset
+    finally:
+        data.close()
+
+
+def read_block(data, offset):
+    rows, currency_count = BLOCK_HEADER.unpack_from(data, offset)
+    offset += BLOCK_HEADER.size
+
+    block = TransactionTable()
+    for _ in xrange(currency_count):
+        length, = NAME_LENGTH.unpack_from(data, offset)
+        offset += NAME_LENGTH.size
+        block.get_currency_code(data[offset:offset + length])
+        offset += length
+
+    for column, (typecode, stored_format) in zip(block.get_columns(), COLUMN_FORMATS):
+        size = rows * struct.calcsize("<" + stored_format)
+        column.extend(bytes_to_column(data[offset:offset + size], typecode, stored_format))
+        offset += size
+    return block, offset
+
+
+# columns are copied as they are when the platform's array layout matches the stored one
+def column_to_bytes(column, stored_format):
+    if is_stored_layout(column.typecode, stored_format):
+        return column.tostring()
+    if column.typecode in FLOAT_TYPECODES and stored_format not in FLOAT_TYPECODES:
+        column = [int(item) for item in column]
+    return struct.pack("<%d%s" % (len(column), stored_format), *column)
+
+
+def bytes_to_column(data, typecode, stored_format):
+    column = array(typecode)
+    if is_stored_layout(typecode, stored_format):
+        column.fromstring(data)
+    else:
+        column.extend(struct.unpack("<%d%s" % (len(data) // struct.calcsize("<" + stored_format), stored_format),
+                                    data))
+    return column
+
+
+# base units are kept in doubles where array has no 64 bit integer, see fixed_point.UNITS_TYPECODE
+def is_stored_layout(typecode, stored_format):
+    return sys.byteorder == "little" and array(typecode).itemsize == struct.calcsize("<" + stored_format) and \
+        (typecode in FLOAT_TYPECODES) == (stored_format in FLOAT_TYPECODES)
+
+
+class BinaryTransactionFileReader:
+    """
+    Lazily iterates the transactions of a binary standard transaction file one block at a time, tracking how much of
+    the file has been read. Every iteration re-reads the file from the start.
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.total_bytes = os.path.getsize(file_name)
+        self.bytes_read = 0
+
+    def __iter__(self):
+        self.bytes_read = 0
+        for block, offset in iter_blocks(self.file_name):
+            currencies = block.currencies
+            for date, units, value, currency_code, type_code in itertools.izip(*block.get_columns()):
+                yield Transaction.from_units(EPOCH + timedelta(seconds=date),
+                                             Transaction.VALID_TRANSACTION_TYPES[type_code],
+                                             currencies[currency_code],
+                                             units,
+                                             value if value == value else '')
+            self.bytes_read = offset
+
+    # fraction of the file read so far
+    def get_progress(self):
+        return float(self.bytes_read) / self.total_bytes if self.total_bytes else 1.0
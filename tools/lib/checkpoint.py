@@ -0,0 +1,111 @@
+"""
+Binary snapshot of a tax report's open lots and running totals, so the next report can resume from it instead of
+re-reading every earlier purchase.
+
+Layout, little-endian:
+  magic, version
+  algorithm name
+  short term proceeds, short term cost basis, long term proceeds, long term cost basis, fees
+  currency count, then per currency: name, lot count, lots
+Each lot is a fixed-width record of epoch seconds, amount in base units (see fixed_point), value (NaN when unknown) and
+transaction type code.
+"""
+
+from cStringIO import StringIO
+from datetime import datetime, timedelta
+from transaction import Transaction
+
+import struct
+
+MAGIC = "CTXCKPT\0"
+VERSION = 2
+HEADER = struct.Struct("<8sH")
+TOTALS = struct.Struct("<5d")
+COUNT = struct.Struct("<I")
+NAME_LENGTH = struct.Struct("<B")
+LOT = struct.Struct("<qqdB")
+EPOCH = datetime(1970, 1, 1)
+NAN = float("nan")
+
+
+def write_checkpoint(file_name, algorithm, totals, lots_by_currency):
+    with open(file_name, 'wb') as checkpoint_file:
+        checkpoint_file.write(checkpoint_to_bytes(algorithm, totals, lots_by_currency))
+
+
+# returns algorithm, totals and a currency to lots mapping, lots are in the order they were written
+def read_checkpoint(file_name):
+    with open(file_name, 'rb') as checkpoint_file:
+        return checkpoint_from_bytes(checkpoint_file.read(), file_name)
+
+
+def checkpoint_to_bytes(algorithm, totals, lots_by_currency):
+    checkpoint_file = StringIO()
+    checkpoint_file.write(HEADER.pack(MAGIC, VERSION))
+    write_name(checkpoint_file, algorithm)
+    checkpoint_file.write(TOTALS.pack(*totals))
+
+    checkpoint_file.write(COUNT.pack(len(lots_by_currency)))
+    for currency, lots in sorted(lots_by_currency.items()):
+        write_name(checkpoint_file, currency)
+        checkpoint_file.write(COUNT.pack(len(lots)))
+        checkpoint_file.write("".join(pack_lot(lot) for lot in lots))
+    return checkpoint_file.getvalue()
+
+
+# name is what the checkpoint is called in errors
+def checkpoint_from_bytes(data, name):
+    magic, version = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise Exception("%s is not a tax report checkpoint" % name)
+    if version != VERSION:
+        raise Exception("%s is a version %d checkpoint, only version %d is supported" % (name, version, VERSION))
+    offset = HEADER.size
+
+    algorithm, offset = read_name(data, offset)
+    totals = list(TOTALS.unpack_from(data, offset))
+    offset += TOTALS.size
+
+    lots_by_currency = dict()
+    currency_count, = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    for _ in xrange(currency_count):
+        currency, offset = read_name(data, offset)
+        lot_count, = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+
+        lots = list()
+        for _ in xrange(lot_count):
+            lots.append(unpack_lot(data, offset, currency))
+            offset += LOT.size
+        lots_by_currency[currency] = lots
+
+    return algorithm, totals, lots_by_currency
+
+
+def write_name(checkpoint_file, name):
+    checkpoint_file.write(NAME_LENGTH.pack(len(name)))
+    checkpoint_file.write(name)
+
+
+def read_name(data, offset):
+    length, = NAME_LENGTH.unpack_from(data, offset)
+    offset += NAME_LENGTH.size
+    return data[offset:offset + length], offset + length
+
+
+def pack_lot(lot):
+    delta = lot.date - EPOCH
+    return LOT.pack(delta.days * 86400 + delta.seconds,
+                    lot.units,
+                    lot.value if lot.value != '' else NAN,
+                    Transaction.VALID_TRANSACTION_TYPES.index(lot.transaction_type))
+
+
+def unpack_lot(data, offset, currency):
+    timestamp, units, value, type_code = LOT.unpack_from(data, offset)
+    return Transaction.from_units(EPOCH + timedelta(seconds=timestamp),
+                                  Transaction.VALID_TRANSACTION_TYPES[type_code],
+                                  currency,
+                                  units,
+                                  value if value == value else '')
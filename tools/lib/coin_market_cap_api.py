@@ -4,14 +4,33 @@
 CoinMarketCap USD Price History
 
   Print the CoinMarketCap USD price history for a particular cryptocurrency in CSV format.
+
+  download_daily_prices fetches the history of many currencies concurrently for storing in a PriceCache instead.
 """
 
+from HTMLParser import HTMLParser
+from multiprocessing.pool import ThreadPool
+
 import sys
 import re
 import urllib2
 import argparse
 import datetime
 
+READ_SIZE = 16384
+DEFAULT_DOWNLOAD_WORKERS = 4
+
+CURRENCY_SLUGS = {
+    "btc": "bitcoin",
+    "eth": "ethereum",
+    "ltc": "litecoin",
+    "bch": "bitcoin-cash",
+    "bnb": "binance-coin",
+    "xrp": "ripple",
+    "usdt": "tether",
+    "zec": "zcash",
+}
+
 parser = argparse.ArgumentParser()
 
 parser.add_argument("currency", help="This is the name of the crypto, as is shown on coinmarketcap. For BTC, "
@@ -64,9 +83,11 @@ def parse_options(args):
     return currency, start_date, end_date
 
 
-def download_data(currency, start_date, end_date):
+def download_data(currency, start_date, end_date, table_parser=None):
     """
     Download HTML price history for the specified cryptocurrency and time range from CoinMarketCap.
+
+    When a PriceTableParser is given the page is fed to it as it arrives instead of being returned.
     """
 
     url = 'https://coinmarketcap.com/currencies/' + currency + '/historical-data/' + '?start=' \
@@ -76,7 +97,13 @@ def download_data(currency, start_date, end_date):
         page = urllib2.urlopen(url, timeout=10)
         if page.getcode() != 200:
             raise Exception('Failed to load page')
-        html = page.read()
+        if table_parser is None:
+            html = page.read()
+        else:
+            html = None
+            for chunk in iter(lambda: page.read(READ_SIZE), ""):
+                table_parser.feed(chunk)
+            table_parser.close()
         page.close()
 
     except Exception as e:
@@ -88,7 +115,7 @@ def download_data(currency, start_date, end_date):
             print("Error message: " + e.message)
         else:
             print(e)
-            sys.exit(1)
+        raise
 
     return html
 
@@ -102,31 +129,124 @@ def extract_data(html):
 
     We need to derive the "average" price for the provided data.
     """
+    table_parser = PriceTableParser()
+    table_parser.feed(html)
+    table_parser.close()
+    return table_parser.header, table_parser.rows
 
-    head = re.search(r'<thead>(.*)</thead>', html, re.DOTALL).group(1)
-    header = re.findall(r'<th .*>([\w ]+)</th>', head)
-    header.append('Average (High + Low / 2)')
 
-    body = re.search(r'<tbody>(.*)</tbody>', html, re.DOTALL).group(1)
-    raw_rows = re.findall(r'<tr[^>]*>' + r'\s*<td[^>]*>([^<]+)</td>' * 7 + r'\s*</tr>', body)
+class PriceTableParser(HTMLParser):
+    """
+    Incrementally parses the price history table, so a page can be fed in chunks as it downloads.
 
-    # strip commas
-    rows = []
-    for row in raw_rows:
+    header holds the column names followed by the average column and rows the cells of every complete row with commas
+    stripped, followed by the average of its high and low.
+    """
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.header = list()
+        self.rows = list()
+        self.section = None
+        self.cell = None
+        self.row = None
+        self.high_index = None
+        self.low_index = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("thead", "tbody"):
+            self.section = tag
+        elif tag == "tr":
+            self.row = list()
+        elif tag in ("th", "td"):
+            self.cell = list()
+
+    def handle_endtag(self, tag):
+        if tag in ("thead", "tbody"):
+            self.section = None
+            if tag == "thead":
+                self.end_header()
+        elif tag in ("th", "td") and self.cell is not None:
+            if self.row is not None:
+                self.row.append("".join(self.cell).strip())
+            self.cell = None
+        elif tag == "tr" and self.row is not None:
+            if self.section == "thead":
+                self.header.extend(self.row)
+            elif self.section == "tbody" and self.high_index is not None and len(self.row) == len(self.header) - 1:
+                self.end_row(self.row)
+            self.row = None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+    # column names keep only letters, digits and spaces, i.e. "Close**" is "Close"
+    def end_header(self):
+        self.header = ["".join(c for c in name if c.isalnum() or c in " _").strip() for name in self.header]
+        self.high_index = self.header.index('High')
+        self.low_index = self.header.index('Low')
+        self.header.append('Average (High + Low / 2)')
+
+    def end_row(self, row):
         row = [field.translate(None, ',') for field in row]
-        rows.append(row)
-
-    # calculate averages
-    def append_average(row):
-        high = float(row[header.index('High')])
-        low = float(row[header.index('Low')])
-        average = (high + low) / 2
+        average = (float(row[self.high_index]) + float(row[self.low_index])) / 2
         row.append('{:.2f}'.format(average))
-        return row
+        self.rows.append(row)
+
 
-    rows = [append_average(row) for row in rows]
+def get_currency_slug(currency):
+    """
+    Map a currency symbol such as btc to the name CoinMarketCap uses in its urls.
+    """
+    return CURRENCY_SLUGS.get(currency.lower(), currency.lower())
 
-    return header, rows
+
+def get_daily_prices(currency, start_date, end_date):
+    """
+    Download the average USD price of a currency symbol for every day from start_date to end_date (datetime.date).
+
+    Returns a list of (datetime.date, price) tuples. This is one request for the whole range.
+    """
+    table_parser = PriceTableParser()
+    download_data(get_currency_slug(currency), start_date.strftime("%Y%m%d"), end_date.strftime("%Y%m%d"),
+                  table_parser)
+
+    # commas have been stripped from the dates, i.e. "Oct 01 2017"
+    date_index = table_parser.header.index('Date')
+    return [(datetime.datetime.strptime(row[date_index], "%b %d %Y").date(), float(row[-1]))
+            for row in table_parser.rows]
+
+
+def download_daily_prices(currencies, start_date, end_date, max_workers=DEFAULT_DOWNLOAD_WORKERS):
+    """
+    Download the daily prices of many currencies concurrently, one request per currency.
+
+    Returns a currency to list of (datetime.date, price) mapping. Currencies that fail to download are left out.
+    """
+    def download(currency):
+        try:
+            return currency, get_daily_prices(currency, start_date, end_date)
+        except Exception:
+            return currency, None
+
+    currencies = sorted(set(currencies))
+    if not currencies:
+        return dict()
+
+    pool = ThreadPool(min(max_workers, len(currencies)))
+    try:
+        return dict((currency, daily_prices) for currency, daily_prices in pool.imap_unordered(download, currencies)
+                    if daily_prices)
+    finally:
+        pool.close()
+        pool.join()
+
+
+# saves daily prices under the same (yyyy-mm-dd, currency) keys the price lookups use
+def store_daily_prices(price_cache, currency, daily_prices):
+    for date, price in daily_prices:
+        price_cache.set((date.strftime("%Y-%m-%d"), currency), price)
+    price_cache.commit()
 
 
 def render_csv_data(header, rows):
@@ -139,10 +259,23 @@ def render_csv_data(header, rows):
         print(','.join(row))
 
 
-def main(currency, start_date, end_date):
-    html = download_data(currency, start_date, end_date)
-    header, rows = extract_data(html)
+def main(argv=None):
+    args = parser.parse_args(argv)
+    currency, start_date, end_date = parse_options(args)
+    table_parser = PriceTableParser()
+    download_data(currency, start_date, end_date, table_parser)
+    header, rows = table_parser.header, table_parser.rows
+
+    if not args.dataframe:
+        render_csv_data(header, rows)
+        return None
+
+    # pandas is only needed for --dataframe
+    import pandas
+    return pandas.DataFrame(rows, columns=header)
 
 
 if __name__ == '__main__':
-    df = main()
\ No newline at end of file
+    df = main()
+    if df is not None:
+        print(df)
\ No newline at end of file
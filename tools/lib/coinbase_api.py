@@ -1,15 +1,61 @@
+from requests.adapters import HTTPAdapter
+from utils import RateLimiter
+
 import requests
+import time
 
+COINBASE_API_URL = "https://api.coinbase.com"
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
 
-# currency_pair examples = "eth-usd", "btc-usd"
-def get_historic_price(currency, date):
-    # Documentation: https://developers.coinbase.com/api/v2?python#get-spot-price
-    currency_pair = currency + "-usd"
-    resp = requests.get("https://api.coinbase.com/v2/prices/%s/spot" % currency_pair,
-                        headers=get_headers(),
-                        params={"date": date})
 
-    return resp.json()["data"]["amount"]
+class CoinbaseClient:
+    # base_url can point at a local stand-in server for testing
+    def __init__(self, base_url=COINBASE_API_URL, pool_size=10, requests_per_second=10, max_retries=5,
+                 backoff_factor=0.5, timeout=10):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(requests_per_second)
+
+        # one pooled session shared by every thread doing lookups
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    # currency_pair examples = "eth-usd", "btc-usd"
+    def get_historic_price(self, currency, date):
+        # Documentation: https://developers.coinbase.com/api/v2?python#get-spot-price
+        currency_pair = currency + "-usd"
+        url = "%s/v2/prices/%s/spot" % (self.base_url, currency_pair)
+
+        for attempt in xrange(self.max_retries + 1):
+            self.rate_limiter.wait()
+            try:
+                resp = self.session.get(url, headers=get_headers(), params={"date": date}, timeout=self.timeout)
+            except requests.RequestException:
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if resp.status_code not in RETRY_STATUS_CODES:
+                    break
+                if attempt == self.max_retries:
+                    resp.raise_for_status()
+            time.sleep(self.backoff_factor * 2 ** attempt)
+
+        # coinbase responds with an "errors" list instead of "data" for dates it has no price for
+        data = resp.json().get("data")
+        if not data:
+            return None
+        return data["amount"]
+
+
+default_client = CoinbaseClient()
+
+
+def get_historic_price(currency, date):
+    return default_client.get_historic_price(currency, date)
 
 
 def is_coinbase_price_available(currency):
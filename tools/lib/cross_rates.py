@@ -0,0 +1,71 @@
+"""
+Values trades from the other side of the same trade.
+
+A pair trade is written as two trade transactions at the same time in different currencies with opposite signs, such
+as XYZ bought and BTC sold on Binance. Only converters that write both sides of a trade know which rows belong
+together, so they give both rows the same pair id, see TransactionTable.new_pair_id; unrelated trades that happen in
+the same second are never paired. Once either side has a US dollar price, the other side's price follows from the
+amounts. Prices found this way are indexed by time, so a currency that is only ever traded against other coins, such as
+BNB, can in turn price the trades and fees quoted in it.
+"""
+
+from transaction_table import to_timestamp
+
+import bisect
+import collections
+
+# currencies valued at a fixed number of US dollars
+FIXED_USD_PRICES = {"usd": 1.0, "usdt": 1.0}
+# indexed prices older than this are not used
+DEFAULT_MAX_AGE_SECONDS = 86400
+
+
+# trades marked with the same pair id, in the order their second side appears. Transactions without a pair id, such
+# as Transaction instances, are never paired.
+def find_pair_trades(transactions):
+    pairs = list()
+    first_sides = dict()
+    for transaction in transactions:
+        pair_id = getattr(transaction, "pair_id", 0)
+        if not pair_id:
+            continue
+        first = first_sides.pop(pair_id, None)
+        if first is None:
+            first_sides[pair_id] = transaction
+        elif is_pair_trade(first, transaction):
+            pairs.append((first, transaction))
+    return pairs
+
+
+def is_pair_trade(first, second):
+    return first.transaction_type == "trade" and second.transaction_type == "trade" \
+        and first.date == second.date \
+        and first.currency != second.currency \
+        and first.amount != 0 and second.amount != 0 \
+        and (first.amount < 0) != (second.amount < 0)
+
+
+class PriceIndex:
+    """
+    US dollar prices per currency ordered by time. get returns the latest price at or before a date, as long as it is
+    at most max_age_seconds old.
+    """
+    def __init__(self, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        self.max_age_seconds = max_age_seconds
+        self.prices = collections.defaultdict(list)
+
+    def add(self, currency, date, price):
+        bisect.insort(self.prices[currency], (to_timestamp(date), price))
+
+    def get(self, currency, date):
+        prices = self.prices.get(currency)
+        if not prices:
+            return None
+        timestamp = to_timestamp(date)
+        index = bisect.bisect_right(prices, (timestamp, float("inf"))) - 1
+        if index < 0 or timestamp - prices[index][0] > self.max_age_seconds:
+            return None
+        return prices[index][1]
+
+    def __len__(self):
+        return sum(len(prices) for prices in self.prices.values())
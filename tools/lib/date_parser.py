@@ -0,0 +1,63 @@
+from datetime import datetime
+
+
+class DateParser:
+    """
+    Parses the timestamps of one file or column.
+
+    The first format that works is remembered and tried first for every later timestamp, fixed-width ISO timestamps
+    are sliced into integers instead of going through strptime, and repeated timestamp strings are cached.
+    """
+    ISO_FORMATS = {"%Y-%m-%d %H:%M:%S": " ", "%Y-%m-%dT%H:%M:%S": "T"}
+    CACHE_SIZE = 100000
+
+    def __init__(self, formats):
+        self.formats = list(formats)
+        self.format = None
+        self.cache = dict()
+
+    def parse(self, date_string):
+        date = self.cache.get(date_string)
+        if date is None:
+            date = self.parse_uncached(date_string)
+            if len(self.cache) >= self.CACHE_SIZE:
+                self.cache.clear()
+            self.cache[date_string] = date
+        return date
+
+    def parse_uncached(self, date_string):
+        if self.format is not None:
+            try:
+                return self.parse_format(date_string, self.format)
+            except ValueError:
+                pass
+
+        for fmt in self.formats:
+            try:
+                date = self.parse_format(date_string, fmt)
+            except ValueError:
+                continue
+            self.format = fmt
+            return date
+
+        raise ValueError("None of the datetime formats were valid for %s" % date_string)
+
+    # ISO timestamps that are not fixed width, such as "2017-1-5 3:04:05", are left to strptime
+    @staticmethod
+    def parse_format(date_string, fmt):
+        separator = DateParser.ISO_FORMATS.get(fmt)
+        if separator is not None:
+            try:
+                return DateParser.parse_iso(date_string, separator)
+            except ValueError:
+                pass
+        return datetime.strptime(date_string, fmt)
+
+    # example: "2017-08-02 10:13:36"
+    @staticmethod
+    def parse_iso(date_string, separator):
+        if len(date_string) != 19 or date_string[4] != "-" or date_string[7] != "-" or date_string[10] != separator \
+                or date_string[13] != ":" or date_string[16] != ":":
+            raise ValueError("%s is not a fixed width timestamp" % date_string)
+        return datetime(int(date_string[0:4]), int(date_string[5:7]), int(date_string[8:10]),
+                        int(date_string[11:13]), int(date_string[14:16]), int(date_string[17:19]))
@@ -0,0 +1,161 @@
+from array import array
+from datetime import timedelta
+from fixed_point import UNITS_TYPECODE, format_units, from_units, to_exact_amount, to_units
+from itertools import imap, izip
+from transaction import Transaction
+from transaction_table import EPOCH, to_timestamp
+
+import csv
+
+LONG_TERM_SECONDS = 365 * 86400
+NAN = float("nan")
+
+
+class DisposalRecords(object):
+    """
+    Columnar buffer of every lot matched against a sale or fee: when the lot was acquired and disposed, the quantity in
+    base units (see fixed_point), its unit cost and unit proceeds, the currency and whether it paid a fee.
+
+    Matching only appends to the columns. Short and long term totals are computed from the columns afterwards, so they
+    can be regenerated from saved records without matching again.
+    """
+    HEADER_ROW = ["Currency", "Date Acquired", "Date Disposed", "Quantity", "Unit Cost", "Unit Proceeds", "Fee"]
+
+    def __init__(self):
+        self.acquired_dates = array('l')
+        self.disposed_dates = array('l')
+        self.quantities = array(UNITS_TYPECODE)
+        self.unit_costs = array('d')
+        self.unit_proceeds = array('d')
+        self.currency_codes = array('H')
+        self.fee_flags = array('b')
+        self.currencies = list()
+        self.currency_to_code = dict()
+
+    def __len__(self):
+        return len(self.quantities)
+
+    def get_currency_code(self, currency):
+        code = self.currency_to_code.get(currency)
+        if code is None:
+            code = len(self.currencies)
+            self.currencies.append(currency)
+            self.currency_to_code[currency] = code
+        return code
+
+    def append(self, acquired_date, disposed_date, quantity, unit_cost, unit_proceeds, currency, is_fee):
+        self.acquired_dates.append(to_timestamp(acquired_date))
+        self.disposed_dates.append(to_timestamp(disposed_date))
+        self.quantities.append(quantity)
+        self.unit_costs.append(unit_cost if unit_cost != '' else NAN)
+        self.unit_proceeds.append(unit_proceeds if unit_proceeds != '' else NAN)
+        self.currency_codes.append(self.get_currency_code(currency))
+        self.fee_flags.append(is_fee)
+
+    def extend(self, records):
+        codes = [self.get_currency_code(currency) for currency in records.currencies]
+        self.acquired_dates.extend(records.acquired_dates)
+        self.disposed_dates.extend(records.disposed_dates)
+        self.quantities.extend(records.quantities)
+        self.unit_costs.extend(records.unit_costs)
+        self.unit_proceeds.extend(records.unit_proceeds)
+        self.currency_codes.extend(array('H', [codes[code] for code in records.currency_codes]))
+        self.fee_flags.extend(records.fee_flags)
+
+    def truncate(self, length):
+        for column in self.get_columns():
+            del column[length:]
+
+    def get_columns(self):
+        return [self.acquired_dates, self.disposed_dates, self.quantities, self.unit_costs, self.unit_proceeds,
+                self.currency_codes, self.fee_flags]
+
+    # returns short term proceeds, short term cost basis, long term proceeds, long term cost basis and fees
+    # totals are added on to the ones given, in the order the disposals were made, from the disposal at start on
+    def summarize(self, totals=None, start=0):
+        totals = list(totals) if totals is not None else [0, 0, 0, 0, 0]
+        for acquired_date, disposed_date, quantity, unit_cost, unit_proceeds, is_fee in izip(
+                self.acquired_dates[start:], self.disposed_dates[start:], imap(from_units, self.quantities[start:]),
+                self.unit_costs[start:], self.unit_proceeds[start:], self.fee_flags[start:]):
+            if is_fee:
+                totals[4] += abs(quantity * unit_cost)
+            elif disposed_date > acquired_date + LONG_TERM_SECONDS:
+                totals[2] += quantity * unit_proceeds
+                totals[3] += quantity * unit_cost
+            else:
+                totals[0] += quantity * unit_proceeds
+                totals[1] += quantity * unit_cost
+        return totals
+
+    def get_rows(self):
+        for acquired_date, disposed_date, quantity, unit_cost, unit_proceeds, currency_code, is_fee in izip(
+                *self.get_columns()):
+            yield [self.currencies[currency_code],
+                   EPOCH + timedelta(seconds=acquired_date),
+                   EPOCH + timedelta(seconds=disposed_date),
+                   to_exact_amount(quantity),
+                   unit_cost if unit_cost == unit_cost else '',
+                   unit_proceeds if unit_proceeds == unit_proceeds else '',
+                   1 if is_fee else 0]
+
+    def write_to_file(self, file_name):
+        with open(file_name, 'wb') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(self.HEADER_ROW)
+            writer.writerows(self.get_rows())
+
+    @classmethod
+    def read_from_file(cls, file_name):
+        records = cls()
+        with open(file_name, 'rb') as csv_file:
+            csv_records = csv.reader(csv_file)
+            csv_records.next()
+
+            for currency, acquired_date, disposed_date, quantity, unit_cost, unit_proceeds, is_fee in csv_records:
+                records.append(Transaction.DATE_PARSER.parse(acquired_date),
+                               Transaction.DATE_PARSER.parse(disposed_date),
+                               to_units(quantity),
+                               float(unit_cost) if unit_cost else '',
+                               float(unit_proceeds) if unit_proceeds else '',
+                               currency,
+                               is_fee == "1")
+        return records
+
+    # one row per lot matched against a sale in the layout of IRS form 8949, with amounts in whole cents as the form is
+    # filled in. Fees are not sales and are left out
+    def write_form_8949(self, file_name):
+        rows = list()
+        for acquired_date, disposed_date, quantity, unit_cost, unit_proceeds, currency_code, is_fee in izip(
+                *self.get_columns()):
+            if is_fee:
+                continue
+            amount = from_units(quantity)
+            proceeds = to_cents(amount * unit_proceeds) if unit_proceeds == unit_proceeds else None
+            cost_basis = to_cents(amount * unit_cost) if unit_cost == unit_cost else None
+            rows.append([disposed_date,
+                         "%s %s" % (format_units(quantity), self.currencies[currency_code].upper()),
+                         (EPOCH + timedelta(seconds=acquired_date)).strftime("%m/%d/%Y"),
+                         (EPOCH + timedelta(seconds=disposed_date)).strftime("%m/%d/%Y"),
+                         format_cents(proceeds),
+                         format_cents(cost_basis),
+                         format_cents(proceeds - cost_basis if proceeds is not None and cost_basis is not None
+                                      else None),
+                         "Long" if disposed_date > acquired_date + LONG_TERM_SECONDS else "Short"])
+        rows.sort(key=lambda row: row[0])
+
+        with open(file_name, 'wb') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["Description", "Date Acquired", "Date Sold", "Proceeds", "Cost Basis", "Gain or Loss",
+                             "Term"])
+            writer.writerows(row[1:] for row in rows)
+
+
+def to_cents(dollars):
+    return int(round(dollars * 100))
+
+
+# cents as dollars with two decimals, empty when the amount is not known
+def format_cents(cents):
+    if cents is None:
+        return ''
+    return "%s%d.%02d" % ("-" if cents < 0 else "", abs(cents) // 100, abs(cents) % 100)
@@ -1,18 +1,37 @@
 from abc import ABCMeta, abstractmethod
 from transaction import Transaction
-from datetime import datetime
+from transaction_table import TransactionTable
+from date_parser import DateParser
 from utils import find
 
-import re
+import csv
+import itertools
+import multiprocessing
+import os
 
 
 class ExchangeConverter:
+    """
+    Reads the rows of one exchange export into standard transactions.
+
+    Every row is converted on its own, so an export can be split into chunks of rows that are converted separately as
+    long as each chunk is preceded by the HEADER_ROWS first rows of the file. Converters that reverse their rows set
+    REVERSES_ROWS, their chunks are joined in reverse order.
+    """
     __metaclass__ = ABCMeta
+    HEADER_ROWS = 1
+    REVERSES_ROWS = False
 
+    # returns a TransactionTable
     @abstractmethod
     def get_standard_transactions(self):
         pass
 
+    # whether the first rows of an export, see SNIFF_ROWS, are laid out the way this converter reads them
+    @staticmethod
+    def matches_header(first_rows):
+        return False
+
 
 class GdaxExchangeConverter(ExchangeConverter):
     TYPE_TO_TRANSACTION_TYPE_DICT = {
@@ -24,14 +43,19 @@ class GdaxExchangeConverter(ExchangeConverter):
 
     def __init__(self, csv_reader_data):
         self.csv_reader_data = csv_reader_data
+        self.date_parser = DateParser(["%Y-%m-%dT%H:%M:%S"])
 
         # remove first line
         self.csv_reader_data.next()
 
+    @staticmethod
+    def matches_header(first_rows):
+        return bool(first_rows) and first_rows[0][:3] == ["type", "time", "amount"]
+
     # Format:
     # type, time, amount, balance, currency, transfer id, trace id, order id
     def get_standard_transactions(self):
-        transactions = []
+        transactions = TransactionTable()
         for row in self.csv_reader_data:
             t = Transaction(self.get_date(row),
                             self.get_transaction_type(row),
@@ -40,10 +64,9 @@ class GdaxExchangeConverter(ExchangeConverter):
             transactions.append(t)
         return transactions
 
-    @staticmethod
-    def get_date(row):
+    def get_date(self, row):
         try:
-            return datetime.strptime(row[1][:-5], "%Y-%m-%dT%H:%M:%S")
+            return self.date_parser.parse(row[1][:-5])
         except ValueError:
             return None
 
@@ -67,9 +90,10 @@ class GeminiExchangeConverter(ExchangeConverter):
         'Buy': 'trade',
         'Sell': 'trade'
     }
-# Format: # date, time, type, symbol, specification, liquidity, trading fee, usd amount, trading fee(usd), usd balance,
-    # btc amount, trading fee(btc), btc balance, eth amount, eth balance, trade id, order id, order date, order time,
-    # client order id, api session, tx hash, deposit tx output, withdrawal destination, withdrawal tx output
+    # Format: # date, time, type, symbol, specification, liquidity, trading fee, usd amount, trading fee(usd),
+    # usd balance, then "<SYM> Amount", "Trading Fee (<SYM>)" and "<SYM> Balance" columns for every listed asset,
+    # trade id, order id, order date, order time, client order id, api session, tx hash, deposit tx output,
+    # withdrawal destination, withdrawal tx output
     def __init__(self, csv_reader_data):
         self.csv_reader_data = csv_reader_data
 
@@ -78,74 +102,72 @@ class GeminiExchangeConverter(ExchangeConverter):
         self.time_index = find(headers, "Time (UTC)")
         self.type_index = find(headers, "Type")
         self.symbol_index = find(headers, "Symbol")
-        self.btc_amount_index = find(headers, "BTC Amount")
-        self.btc_fee_index = find(headers, "Trading Fee (BTC)")
-        self.eth_amount_index = find(headers, "ETH Amount")
         self.usd_amount_index = find(headers, "USD Amount")
-        self.usd_fee_index = find(headers, "Trading Fee (USD)")
+        self.row_plan = self.get_row_plan(headers)
+        self.date_parser = DateParser(["%Y-%m-%d %H:%M:%S"])
+
+        self.transactions = TransactionTable()
 
-        self.transactions = list()
+    @staticmethod
+    def matches_header(first_rows):
+        return bool(first_rows) and "Time (UTC)" in first_rows[0] and "Symbol" in first_rows[0]
+
+    # (column index, currency, is fee) of every amount a row can hold, found once from the header. Each currency's
+    # amount comes before its fee, and fees of currencies without an amount column (USD) come last.
+    @staticmethod
+    def get_row_plan(headers):
+        amount_plan = list()
+        fee_indexes = dict()
+        for index, header in enumerate(headers):
+            if header.endswith(" Amount") and header != "USD Amount":
+                amount_plan.append((index, header[:-len(" Amount")].lower(), False))
+            elif header.startswith("Trading Fee (") and header.endswith(")"):
+                fee_indexes[header[len("Trading Fee ("):-1].lower()] = index
+
+        row_plan = list()
+        for index, currency, is_fee in amount_plan:
+            row_plan.append((index, currency, is_fee))
+            if currency in fee_indexes:
+                row_plan.append((fee_indexes.pop(currency), currency, True))
+        row_plan.extend((index, currency, True) for currency, index in sorted(fee_indexes.items(),
+                                                                            key=lambda x: x[1]))
+        return row_plan
 
     def get_standard_transactions(self):
         for row in self.csv_reader_data:
-            if self.get_date(row):
-                self.maybe_create_btc_transaction(row)
-                self.maybe_create_btc_fee(row)
-                self.maybe_create_eth_transaction(row)
-                self.maybe_create_usd_fee(row)
+            date = self.get_date(row)
+            if not date:
+                continue
+            transaction_type = None
+            for amount_index, currency, is_fee in self.row_plan:
+                if not row[amount_index]:
+                    continue
+                amount = self.get_amount(row[amount_index])
+                if is_fee:
+                    self.transactions.append(Transaction(date, "fee", currency, amount))
+                else:
+                    transaction_type = transaction_type or self.get_transaction_type(row)
+                    self.transactions.append(Transaction(date,
+                                                         transaction_type,
+                                                         currency,
+                                                         amount,
+                                                         self.get_value(row, amount)))
         return self.transactions
 
-    def maybe_create_btc_transaction(self, row):
-        t = self.maybe_create_generic_transaction(row, self.btc_amount_index, "btc")
-        if t:
-            self.transactions.append(t)
-
-    def maybe_create_eth_transaction(self, row):
-        t = self.maybe_create_generic_transaction(row, self.eth_amount_index, "eth")
-        if t:
-            self.transactions.append(t)
-
-    def maybe_create_btc_fee(self, row):
-        t = self.maybe_create_generic_fee(row, self.btc_fee_index, "btc")
-        if t:
-            self.transactions.append(t)
-
-    def maybe_create_usd_fee(self, row):
-        t = self.maybe_create_generic_fee(row, self.usd_fee_index, "usd")
-        if t:
-            self.transactions.append(t)
-
-    def maybe_create_generic_transaction(self, row, amount_index, currency):
-        if row[amount_index]:
-            amount = self.get_amount(row[amount_index])
-            value = self.get_value(row, amount)
-            return Transaction(self.get_date(row),
-                               self.get_transaction_type(row),
-                               currency,
-                               amount,
-                               value)
-
-    def maybe_create_generic_fee(self, row, amount_index, currency):
-        if row[amount_index]:
-            return Transaction(self.get_date(row),
-                               "fee",
-                               currency,
-                               self.get_amount(row[amount_index]))
-
     # example: "10/15/2017  12:00:18 AM"
     def get_date(self, row):
         try:
-            return datetime.strptime(row[self.date_index] + " " + row[self.time_index][:-4], "%Y-%m-%d %H:%M:%S")
+            return self.date_parser.parse(row[self.date_index] + " " + row[self.time_index][:-4])
         except ValueError:
             return None
 
     def get_transaction_type(self, row):
         return GeminiExchangeConverter.TYPE_TO_TRANSACTION_TYPE_DICT[row[self.type_index]]
 
+    # examples: "1.5 BTC", "(0.5 ETH)", "$1,234.56", "($10.00)", negative amounts are in parentheses
     @staticmethod
     def get_amount(cell_value):
-        val = cell_value.replace(",","")
-        amount = float(re.search("\d+\.\d+", val).group(0))
+        amount = float(cell_value.translate(None, "$,()").split(" ", 1)[0])
         if "(" in cell_value:
             amount = -amount
         return amount
@@ -157,6 +179,7 @@ class GeminiExchangeConverter(ExchangeConverter):
 
 class CoinbaseExchangeConverter(ExchangeConverter):
     DATETIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%m/%d/%y %H:%M"]
+    HEADER_ROWS = 5
 
     # format:
     # timestamp, balance, amount, currency, to, notes, instantly exchanged, transfer total, transfer total currency,
@@ -175,8 +198,14 @@ class CoinbaseExchangeConverter(ExchangeConverter):
         self.transfer_total_currency_index = find(headers, "Transfer Total Currency")
         self.transfer_fee_index = find(headers, "Transfer Fee")
         self.transfer_fee_currency_index = find(headers, "Transfer Fee Currency")
+        self.date_parser = DateParser(self.DATETIME_FORMATS)
+
+        self.transactions = TransactionTable()
 
-        self.transactions = list()
+    # the header is preceded by a title, user, account and empty row
+    @staticmethod
+    def matches_header(first_rows):
+        return len(first_rows) > 4 and first_rows[0][:1] == ["Transactions"] and "Timestamp" in first_rows[4]
 
     def get_standard_transactions(self):
         for row in self.csv_reader_data:
@@ -202,11 +231,10 @@ class CoinbaseExchangeConverter(ExchangeConverter):
         else:
             timestamp_str = row[self.timestamp_index]
 
-        for format in self.DATETIME_FORMATS:
-            try:
-                return datetime.strptime(timestamp_str, format)
-            except ValueError:
-                pass
+        try:
+            return self.date_parser.parse(timestamp_str)
+        except ValueError:
+            return None
 
     def get_amount(self, row):
         return row[self.amount_index]
@@ -233,6 +261,8 @@ class CoinbaseExchangeConverter(ExchangeConverter):
 
 class BinanceExchangeConverter(ExchangeConverter):
     CURRENCY_EXCHANGES = ["BTC", "ETH", "BNB", "USDT"]
+    # exports are newest first
+    REVERSES_ROWS = True
 
     # format:
     # date, market, type, price, amount, total, fee, fee coin
@@ -248,8 +278,19 @@ class BinanceExchangeConverter(ExchangeConverter):
         self.amount_index = find(headers, "Amount")
         self.fee_index = find(headers, "Fee")
         self.fee_currency_index = find(headers, "Fee Coin")
+        self.date_parser = DateParser(["%Y-%m-%d %H:%M:%S"])
 
-        self.transactions = list()
+        self.transactions = TransactionTable()
+
+    # trade history and deposit and withdrawal history are separate exports with different headers
+    @staticmethod
+    def matches_header(first_rows):
+        if not first_rows:
+            return False
+        headers = first_rows[0]
+        is_trades = "Market" in headers and "Fee Coin" in headers
+        is_transfers = headers[:3] == ["Date", "Coin", "Amount"]
+        return is_trades or is_transfers
 
     def get_standard_transactions(self):
         if self.coin_index: # if coin column is present then it is a csv of transfers and not trades
@@ -284,21 +325,23 @@ class BinanceExchangeConverter(ExchangeConverter):
                 self.get_fee_currency(row),
                 self.get_fee(row)))
 
+            # both sides of the trade, see cross_rates.find_pair_trades
+            pair_id = self.transactions.new_pair_id()
             self.transactions.append(Transaction(
                 self.get_date(row),
                 "trade",
                 first_currency,
                 self.get_amount(row)
-            ))
+            ), pair_id)
             self.transactions.append(Transaction(
                 self.get_date(row),
                 "trade",
                 second_currency,
                 self.get_amount(row) * -1.0 * self.get_price(row)
-            ))
+            ), pair_id)
 
     def get_date(self, row):
-        return datetime.strptime(row[self.date_index], "%Y-%m-%d %H:%M:%S")
+        return self.date_parser.parse(row[self.date_index])
 
     def get_currency(self, row):
         for currency in self.CURRENCY_EXCHANGES:
@@ -320,3 +363,112 @@ class BinanceExchangeConverter(ExchangeConverter):
 
     def get_fee_currency(self, row):
         return row[self.fee_currency_index]
+
+
+EXCHANGE_CONVERTERS = {
+    "gdax": GdaxExchangeConverter,
+    "gemini": GeminiExchangeConverter,
+    "coinbase": CoinbaseExchangeConverter,
+    "binance": BinanceExchangeConverter,
+}
+# number of rows read from the start of an export to recognize which exchange it came from
+SNIFF_ROWS = 5
+# size of the pieces large exports are split into to convert them in several processes
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def get_exchange_converter(exchange):
+    if exchange.lower() not in EXCHANGE_CONVERTERS:
+        raise Exception("%s is not a valid exchange" % exchange)
+    return EXCHANGE_CONVERTERS[exchange.lower()]
+
+
+# returns the name of the exchange whose export layout the file has, or None if no converter recognizes it
+def detect_exchange(file_name):
+    with open(file_name, 'rb') as csv_file:
+        first_rows = list(itertools.islice(csv.reader(csv_file), SNIFF_ROWS))
+    for exchange, converter in sorted(EXCHANGE_CONVERTERS.items()):
+        if converter.matches_header(first_rows):
+            return exchange
+    return None
+
+
+# exchange is detected from the file when it is not given
+def convert_file(file_name, exchange=None):
+    if exchange is None:
+        exchange = detect_exchange(file_name)
+        if exchange is None:
+            raise Exception("%s is not an export of a supported exchange" % file_name)
+
+    with open(file_name, 'rb') as csv_file:
+        return get_exchange_converter(exchange)(csv.reader(csv_file)).get_standard_transactions()
+
+
+# converts files in worker processes, returns a TransactionTable per file in the order of file_names. Files are split
+# into chunks of about chunk_bytes, so a single large export is converted by every process too.
+def convert_files(file_names, exchange=None, processes=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    tasks_by_file = list()
+    for file_name in file_names:
+        file_exchange = exchange
+        if file_exchange is None:
+            file_exchange = detect_exchange(file_name)
+            if file_exchange is None:
+                raise Exception("%s is not an export of a supported exchange" % file_name)
+        tasks_by_file.append(get_chunk_tasks(file_name, file_exchange, chunk_bytes))
+    tasks = [task for file_tasks in tasks_by_file for task in file_tasks]
+
+    if processes == 1 or len(tasks) < 2:
+        chunks = map(convert_chunk, tasks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            chunks = pool.map(convert_chunk, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    transaction_tables = list()
+    for file_tasks in tasks_by_file:
+        _, file_exchange, _, _ = file_tasks[0]
+        transaction_tables.append(join_chunks(get_exchange_converter(file_exchange), chunks[:len(file_tasks)]))
+        chunks = chunks[len(file_tasks):]
+    return transaction_tables
+
+
+# (file name, exchange, start offset, end offset) of every chunk, offsets are at the start of a row. Rows are assumed
+# not to contain line breaks, which none of the supported exports have.
+def get_chunk_tasks(file_name, exchange, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    file_size = os.path.getsize(file_name)
+    with open(file_name, 'rb') as csv_file:
+        for _ in xrange(get_exchange_converter(exchange).HEADER_ROWS):
+            csv_file.readline()
+        boundaries = [csv_file.tell()]
+
+        for offset in xrange(boundaries[0] + chunk_bytes, file_size, chunk_bytes):
+            # reading from the byte before stops right at offset when a row starts there
+            csv_file.seek(offset - 1)
+            csv_file.readline()
+            if boundaries[-1] < csv_file.tell() < file_size:
+                boundaries.append(csv_file.tell())
+        boundaries.append(max(file_size, boundaries[0]))
+
+    return [(file_name, exchange, start, end) for start, end in zip(boundaries, boundaries[1:])]
+
+
+def convert_chunk(task):
+    file_name, exchange, start, end = task
+    converter = get_exchange_converter(exchange)
+    with open(file_name, 'rb') as csv_file:
+        header_lines = [csv_file.readline() for _ in xrange(converter.HEADER_ROWS)]
+        csv_file.seek(start)
+        lines = csv_file.read(end - start).splitlines(True)
+    return converter(csv.reader(header_lines + lines)).get_standard_transactions()
+
+
+def join_chunks(converter, chunks):
+    if len(chunks) == 1:
+        return chunks[0]
+    transactions = TransactionTable()
+    for chunk in reversed(chunks) if converter.REVERSES_ROWS else chunks:
+        transactions.extend_table(chunk)
+    return transactions
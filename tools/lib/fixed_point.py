@@ -0,0 +1,95 @@
+"""
+Fixed-point amounts.
+
+Amounts are counted in integer base units of AMOUNT_DECIMALS decimals, the satoshi for bitcoin, so adding and
+subtracting them is exact and a partly sold lot never leaves dust such as 1e-17 BTC behind. Decimal strings are parsed
+exactly, amounts with more decimals, such as wei, are rounded to the nearest base unit when they are read.
+
+Base units are kept in arrays of UNITS_TYPECODE, which is 64 bits on every platform. Amounts are limited to MAX_UNITS
+base units, about 92 billion coins, and larger amounts are rejected rather than wrapped around.
+"""
+
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
+
+AMOUNT_DECIMALS = 8
+AMOUNT_SCALE = 10 ** AMOUNT_DECIMALS
+# a float amount is written to the base unit by its repr up to this many base units, about 11 million coins
+FLOAT_EXACT_UNITS = 2 ** 50
+# amounts read through a double, see to_units
+FLOAT_FAST_DIGITS = 7
+FLOAT_FAST_AMOUNT = 10 ** FLOAT_FAST_DIGITS
+
+
+# 'q' where array supports it and 'l' where long is 64 bits. Python 2 on Windows has neither, base units are then kept
+# in doubles, which hold integers exactly up to 2 ** 53
+def get_units_typecode():
+    for typecode in ('q', 'l'):
+        try:
+            if array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:
+            continue
+    return 'd'
+
+
+UNITS_TYPECODE = get_units_typecode()
+MAX_UNITS = 2 ** 53 if UNITS_TYPECODE == 'd' else 2 ** 63 - 1
+
+
+# amount is a decimal string such as "-0.5", an integer, a Decimal or a float, which is taken as its shortest repr.
+# Below FLOAT_FAST_AMOUNT coins, amounts of at most AMOUNT_DECIMALS decimals are below 10 ** 15 base units, where a
+# double multiplied by AMOUNT_SCALE is within a quarter unit of the exact amount, so rounding it is exact.
+def to_units(amount):
+    if isinstance(amount, str):
+        whole, point, fraction = amount.partition(".")
+        try:
+            if not point:
+                return check_units(int(whole) * AMOUNT_SCALE)
+            if fraction.isdigit() and len(fraction) <= AMOUNT_DECIMALS:
+                if len(whole) <= FLOAT_FAST_DIGITS:
+                    return int(round(float(amount) * AMOUNT_SCALE))
+                return check_units(int(whole + fraction.ljust(AMOUNT_DECIMALS, "0")))
+        except ValueError:
+            pass
+    elif isinstance(amount, float):
+        if -FLOAT_FAST_AMOUNT < amount < FLOAT_FAST_AMOUNT:
+            return int(round(amount * AMOUNT_SCALE))
+        amount = repr(amount)
+    elif isinstance(amount, (int, long)):
+        return check_units(amount * AMOUNT_SCALE)
+
+    try:
+        units = (Decimal(amount) * AMOUNT_SCALE).to_integral_value(ROUND_HALF_UP)
+    except ArithmeticError:
+        raise Exception("%s is not a valid amount" % amount)
+    if not units.is_finite():
+        raise Exception("%s is not a valid amount" % amount)
+    return check_units(int(units))
+
+
+def check_units(units):
+    if not -MAX_UNITS <= units <= MAX_UNITS:
+        raise Exception("%s is larger than the largest supported amount, %s" %
+                        (format_units(units), format_units(MAX_UNITS)))
+    return units
+
+
+def from_units(units):
+    return float(units) / AMOUNT_SCALE
+
+
+# the exact decimal string of units, without trailing zeros
+def format_units(units):
+    units = int(units)
+    whole, fraction = divmod(abs(units), AMOUNT_SCALE)
+    fraction = ("%0*d" % (AMOUNT_DECIMALS, fraction)).rstrip("0")
+    return ("-" if units < 0 else "") + str(whole) + ("." + fraction if fraction else "")
+
+
+# the amount units are written out as: a float like any other amount, or the exact decimal string when a float would
+# round it, so an amount read back is always the one written
+def to_exact_amount(units):
+    if -FLOAT_EXACT_UNITS <= units <= FLOAT_EXACT_UNITS:
+        return from_units(units)
+    return format_units(units)
@@ -0,0 +1,127 @@
+"""
+Open lots of a tax report at any point in time, without matching the transactions again.
+
+While a report is matched, HoldingsIndexWriter logs every change to the open lots as a delta: the purchase of a lot
+and the quantity of a lot sold or spent on a fee. Every snapshot_interval deltas the open lots are saved in full as a
+snapshot. Deltas are timestamped by the transaction that caused them and never go back in time, so the holdings at a
+date are the latest snapshot at or before it plus the deltas after that snapshot up to the date. Both are found through
+SQLite indexes, so a query reads at most one snapshot and snapshot_interval deltas however long the history is.
+
+Lots are identified by currency, purchase date and unit cost, the same identity the disposals use. Amounts are integer
+base units, see fixed_point.
+"""
+
+from datetime import timedelta
+from fixed_point import from_units
+from transaction_table import EPOCH, to_timestamp
+
+import collections
+import os
+import sqlite3
+
+DEFAULT_SNAPSHOT_INTERVAL = 10000
+
+
+class HoldingsIndexWriter:
+    def __init__(self, file_name, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL):
+        if os.path.exists(file_name):
+            os.remove(file_name)
+        self.connection = sqlite3.connect(file_name)
+        self.connection.executescript(
+            "CREATE TABLE deltas (sequence INTEGER PRIMARY KEY, timestamp INTEGER NOT NULL, currency TEXT NOT NULL, "
+            "lot_timestamp INTEGER NOT NULL, value REAL, amount INTEGER NOT NULL);"
+            "CREATE INDEX deltas_timestamp ON deltas (timestamp);"
+            "CREATE TABLE snapshots (sequence INTEGER PRIMARY KEY, timestamp INTEGER NOT NULL);"
+            "CREATE INDEX snapshots_timestamp ON snapshots (timestamp);"
+            "CREATE TABLE snapshot_lots (sequence INTEGER NOT NULL, currency TEXT NOT NULL, "
+            "lot_timestamp INTEGER NOT NULL, value REAL, amount INTEGER NOT NULL);"
+            "CREATE INDEX snapshot_lots_sequence ON snapshot_lots (sequence, currency);")
+        self.snapshot_interval = snapshot_interval
+        # (currency, lot timestamp, value) to open base units
+        self.holdings = collections.defaultdict(int)
+        self.pending_deltas = list()
+        self.sequence = 0
+        self.timestamp = None
+
+    # date is when the change happened, units are positive for purchases and negative for sales and fees
+    def record(self, date, lot, units):
+        # lots resumed from a checkpoint are recorded in selection order, which can go back in time
+        timestamp = to_timestamp(date)
+        if self.timestamp is None or timestamp > self.timestamp:
+            self.timestamp = timestamp
+
+        key = (lot.currency, to_timestamp(lot.date), lot.value if lot.value != '' else None)
+        self.holdings[key] += units
+        if not self.holdings[key]:
+            del self.holdings[key]
+
+        self.sequence += 1
+        self.pending_deltas.append((self.sequence, self.timestamp) + key + (units,))
+        if self.sequence % self.snapshot_interval == 0:
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        self.flush()
+        self.connection.execute("INSERT INTO snapshots (sequence, timestamp) VALUES (?, ?)",
+                                (self.sequence, self.timestamp))
+        self.connection.executemany("INSERT INTO snapshot_lots VALUES (?, ?, ?, ?, ?)",
+                                    ((self.sequence,) + key + (amount,) for key, amount in self.holdings.items()))
+
+    def flush(self):
+        self.connection.executemany("INSERT INTO deltas VALUES (?, ?, ?, ?, ?, ?)", self.pending_deltas)
+        self.pending_deltas = list()
+
+    def close(self):
+        self.flush()
+        self.connection.commit()
+        self.connection.close()
+
+
+class HoldingsIndex:
+    """
+    Reads the open lots at a date back from a file written by HoldingsIndexWriter.
+    """
+    def __init__(self, file_name):
+        if not os.path.exists(file_name):
+            raise Exception("%s does not exist" % file_name)
+        self.connection = sqlite3.connect(file_name)
+
+    # returns a currency to list of (purchase date, amount, unit cost or '' when unknown) mapping of the lots open
+    # after every transaction up to and including date, oldest purchase first
+    def get_lots(self, date, currency=None):
+        timestamp = to_timestamp(date)
+        currency_filter, currency_arguments = ("AND currency = ?", (currency,)) if currency else ("", ())
+
+        holdings = collections.defaultdict(int)
+        snapshot = self.connection.execute("SELECT MAX(sequence) FROM snapshots WHERE timestamp <= ?",
+                                           (timestamp,)).fetchone()[0] or 0
+        for lot_currency, lot_timestamp, value, amount in self.connection.execute(
+                "SELECT currency, lot_timestamp, value, amount FROM snapshot_lots WHERE sequence = ? " +
+                currency_filter, (snapshot,) + currency_arguments):
+            holdings[(lot_currency, lot_timestamp, value)] += amount
+
+        last_delta = self.connection.execute("SELECT MAX(sequence) FROM deltas WHERE timestamp <= ?",
+                                             (timestamp,)).fetchone()[0] or 0
+        for lot_currency, lot_timestamp, value, amount in self.connection.execute(
+                "SELECT currency, lot_timestamp, value, amount FROM deltas WHERE sequence > ? AND sequence <= ? " +
+                currency_filter + " ORDER BY sequence", (snapshot, last_delta) + currency_arguments):
+            holdings[(lot_currency, lot_timestamp, value)] += amount
+
+        lots = collections.defaultdict(list)
+        for (lot_currency, lot_timestamp, value), amount in sorted(holdings.items()):
+            if amount > 0:
+                lots[lot_currency].append((EPOCH + timedelta(seconds=lot_timestamp), from_units(amount),
+                                           value if value is not None else ''))
+        return lots
+
+    # returns a currency to (amount, cost basis, lots) mapping, the cost basis leaves out lots of unknown cost
+    def get_holdings(self, date, currency=None):
+        holdings = dict()
+        for lot_currency, lots in self.get_lots(date, currency).items():
+            holdings[lot_currency] = (sum(amount for _, amount, _ in lots),
+                                      sum(amount * value for _, amount, value in lots if value != ''),
+                                      len(lots))
+        return holdings
+
+    def close(self):
+        self.connection.close()
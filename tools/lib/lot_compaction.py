@@ -0,0 +1,114 @@
+"""
+Merges open lots that are sold the same way, so currencies with many small purchases keep few lots.
+
+Lots are merged when they are next to each other in the order they will be sold, were acquired on the same day and
+have the same unit cost, so every sale is matched against the same quantities at the same cost. The merged lot takes
+the latest acquisition time of the day. Lots smaller than dust_units, such as the remainder of a lot that was almost
+sold, are folded into the lot sold after them, or the one sold before them when they are sold last, which moves the
+dust to that lot's date and cost. Every merged lot is written to the audit file so the report can be traced back to
+the original lots.
+"""
+
+from fixed_point import to_exact_amount
+
+import collections
+import csv
+
+DEFAULT_MIN_LOTS = 256
+
+
+class LotCompactor:
+    # one row per lot merged into another: when it was merged, the lot it was merged into and the lot itself
+    AUDIT_HEADER = ["Date", "Currency", "Merged Lot Date", "Merged Lot Unit Cost", "Lot Date", "Lot Unit Cost",
+                    "Quantity", "Reason"]
+
+    # a currency is compacted once it holds min_lots open lots, and again each time it has doubled since
+    def __init__(self, dust_units=0, audit_file=None, min_lots=DEFAULT_MIN_LOTS):
+        self.dust_units = dust_units
+        self.min_lots = min_lots
+        self.compact_at = collections.defaultdict(lambda: min_lots)
+        self.audit_file = open(audit_file, 'wb') if audit_file else None
+        self.audit_writer = csv.writer(self.audit_file) if self.audit_file else None
+        if self.audit_writer is not None:
+            self.audit_writer.writerow(self.AUDIT_HEADER)
+        # number of compactions run and lots merged away, see get_metrics
+        self.compactions = 0
+        self.merged_lots = 0
+        self.folded_lots = 0
+
+    def is_due(self, currency, lot_count):
+        return lot_count >= self.compact_at[currency]
+
+    # lots are in the order they will be sold, returns them compacted in the same order and a (lots, merged lot) pair
+    # for every lot that replaces several
+    def compact(self, date, currency, lots):
+        groups = list()
+        for lot in lots:
+            if groups and is_same_day_and_cost(groups[-1][0], lot):
+                groups[-1].append(lot)
+            else:
+                groups.append([lot])
+        if self.dust_units and len(groups) > 1:
+            groups = self.fold_dust(groups)
+
+        compacted = list()
+        merges = list()
+        for group in groups:
+            if len(group) == 1:
+                compacted.append(group[0])
+                continue
+            merged_lot = self.merge(date, group)
+            compacted.append(merged_lot)
+            merges.append((group, merged_lot))
+
+        self.compactions += 1
+        self.compact_at[currency] = max(self.min_lots, 2 * len(compacted))
+        return compacted, merges
+
+    # groups smaller than dust_units join the group sold after them, or the one sold before them when sold last
+    def fold_dust(self, groups):
+        folded = list()
+        dust = list()
+        for group in groups:
+            if sum(lot.units for lot in group) < self.dust_units:
+                dust.extend(group)
+            else:
+                folded.append(group + dust)
+                dust = list()
+        if not folded:
+            return groups
+        folded[-1].extend(dust)
+        return folded
+
+    # the merged lot has the cost of the group's first lot and the latest acquisition time of the lots merged for
+    # having the same day and cost, so no part of it becomes long term earlier than it would have
+    def merge(self, date, group):
+        head = group[0]
+        merged_lot = head.with_units(sum(lot.units for lot in group))
+        merged_lot.date = max(lot.date for lot in group if is_same_day_and_cost(head, lot))
+        for lot in group:
+            if is_same_day_and_cost(head, lot):
+                reason = "same day and cost"
+                self.merged_lots += lot is not head
+            else:
+                reason = "dust"
+                self.folded_lots += 1
+            if self.audit_writer is not None:
+                self.audit_writer.writerow([date, lot.currency, merged_lot.date, merged_lot.value, lot.date, lot.value,
+                                            to_exact_amount(lot.units), reason])
+        return merged_lot
+
+    def get_metrics(self):
+        return {
+            "compactions": self.compactions,
+            "merged_lots": self.merged_lots,
+            "folded_lots": self.folded_lots,
+        }
+
+    def close(self):
+        if self.audit_file is not None:
+            self.audit_file.close()
+
+
+def is_same_day_and_cost(lot, other_lot):
+    return lot.date.date() == other_lot.date.date() and lot.value == other_lot.value
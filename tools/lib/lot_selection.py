@@ -0,0 +1,263 @@
+from abc import ABCMeta, abstractmethod
+from transaction import Transaction
+
+import collections
+import csv
+import heapq
+
+
+class LotSelector:
+    """
+    Holds the open lots of one currency and decides which lot is sold next.
+
+    pop removes the next lot to match against a taxable transaction. A lot that is only partly sold is handed back
+    through restore so that it is selected again first.
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def push(self, lot):
+        pass
+
+    @abstractmethod
+    def pop(self, transaction):
+        pass
+
+    @abstractmethod
+    def restore(self, lot):
+        pass
+
+    # open lots in an order that selects them the same way again when pushed into an empty selector
+    @abstractmethod
+    def get_lots(self):
+        pass
+
+    def __len__(self):
+        return len(self.get_lots())
+
+    # open lots in the order pop would return them, for lot_compaction
+    def get_selection_order(self):
+        raise Exception("%s lots cannot be compacted" % self.__class__.__name__)
+
+    # replaces the open lots with lots given in the order pop should return them
+    def set_selection_order(self, lots):
+        raise Exception("%s lots cannot be compacted" % self.__class__.__name__)
+
+
+class FifoLotSelector(LotSelector):
+    def __init__(self):
+        self.lots = collections.deque()
+
+    def push(self, lot):
+        self.lots.append(lot)
+
+    def pop(self, transaction):
+        return self.lots.popleft()
+
+    def restore(self, lot):
+        self.lots.appendleft(lot)
+
+    def get_lots(self):
+        return list(self.lots)
+
+    def get_selection_order(self):
+        return list(self.lots)
+
+    def set_selection_order(self, lots):
+        self.lots = collections.deque(lots)
+
+    def __len__(self):
+        return len(self.lots)
+
+
+class LifoLotSelector(LotSelector):
+    def __init__(self):
+        self.lots = list()
+
+    def push(self, lot):
+        self.lots.append(lot)
+
+    def pop(self, transaction):
+        return self.lots.pop()
+
+    def restore(self, lot):
+        self.lots.append(lot)
+
+    def get_lots(self):
+        return list(self.lots)
+
+    def get_selection_order(self):
+        return self.lots[::-1]
+
+    def set_selection_order(self, lots):
+        self.lots = lots[::-1]
+
+    def __len__(self):
+        return len(self.lots)
+
+
+class HifoLotSelector(LotSelector):
+    def __init__(self):
+        # (-value, sequence, lot), the sequence keeps lots with the same value in the order they were bought
+        self.heap = list()
+        self.sequence = 0
+        self.popped_sequence = None
+
+    def push(self, lot):
+        heapq.heappush(self.heap, (-lot.value, self.sequence, lot))
+        self.sequence += 1
+
+    def pop(self, transaction):
+        _, self.popped_sequence, lot = heapq.heappop(self.heap)
+        return lot
+
+    def restore(self, lot):
+        heapq.heappush(self.heap, (-lot.value, self.popped_sequence, lot))
+
+    def get_lots(self):
+        return [lot for _, _, lot in sorted(self.heap, key=lambda entry: entry[1])]
+
+    def get_selection_order(self):
+        return [lot for _, _, lot in sorted(self.heap)]
+
+    # a sorted list is a valid heap
+    def set_selection_order(self, lots):
+        self.heap = [(-lot.value, sequence, lot) for sequence, lot in enumerate(lots)]
+        self.sequence = len(lots)
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class SpecificIdentificationLotSelector(LotSelector):
+    """
+    Sells the lots designated for each sale by their purchase date, then falls back to the oldest open lot.
+
+    designations maps (sale date, currency) to a list of purchase dates.
+
+    Lots are indexed by key, in purchase order, in a heap for the oldest lot and by purchase date. A lot keeps its place
+    in the heap while it is sold by designation, so a lot that is only partly sold is not taken ahead of older lots. A
+    sold lot's key is dropped from its date as soon as it reaches the front, dates without open lots are deleted, and
+    the heap is rebuilt once most of its keys are sold by designation, so memory follows the open lots rather than
+    every lot bought.
+    """
+    # the heap is only rebuilt once it holds more sold keys than this, so small selectors never are
+    MIN_SOLD_KEYS = 1024
+
+    def __init__(self, designations):
+        self.designations = designations
+        self.designation_cursors = dict()
+        self.lots = dict()
+        # keys only ever grow, so pushing a new key keeps the heap in purchase order without sifting
+        self.order = list()
+        self.lot_keys_by_date = collections.defaultdict(collections.deque)
+        self.next_key = 0
+        self.popped_key = None
+        self.popped_key_in_order = False
+
+    def push(self, lot):
+        key = self.next_key
+        self.next_key += 1
+        self.lots[key] = lot
+        heapq.heappush(self.order, key)
+        self.lot_keys_by_date[lot.date].append(key)
+
+    def pop(self, transaction):
+        # designations already used up by a sale are skipped through a cursor per sale
+        designation_key = (transaction.date, transaction.currency)
+        lot_dates = self.designations.get(designation_key, [])
+        cursor = self.designation_cursors.get(designation_key, 0)
+        while cursor < len(lot_dates):
+            key = self.pop_open_key(self.lot_keys_by_date.get(lot_dates[cursor]))
+            self.drop_sold_keys(lot_dates[cursor])
+            if key is not None:
+                self.designation_cursors[designation_key] = cursor
+                return self.remove(key, in_order=True)
+            cursor += 1
+        if lot_dates:
+            self.designation_cursors[designation_key] = cursor
+
+        while self.order:
+            key = heapq.heappop(self.order)
+            if key in self.lots:
+                return self.remove(key, in_order=False)
+        raise IndexError("pop from empty lot selector")
+
+    # keys of lots sold through the heap are skipped here
+    def pop_open_key(self, keys):
+        while keys:
+            key = keys.popleft()
+            if key in self.lots:
+                return key
+        return None
+
+    # in_order tells whether the key is still in the heap, where restore finds it again
+    def remove(self, key, in_order):
+        self.popped_key = key
+        self.popped_key_in_order = in_order
+        lot = self.lots.pop(key)
+        self.drop_sold_keys(lot.date)
+        if len(self.order) - len(self.lots) > max(self.MIN_SOLD_KEYS, len(self.lots)):
+            # a sorted list is a valid heap
+            self.order = sorted(self.lots)
+            self.popped_key_in_order = False
+        return lot
+
+    # keys of a date are in purchase order, and lots are only ever sold from the first open one, so sold keys are
+    # always at the front
+    def drop_sold_keys(self, date):
+        keys = self.lot_keys_by_date.get(date)
+        if keys is None:
+            return
+        while keys and keys[0] not in self.lots:
+            keys.popleft()
+        if not keys:
+            del self.lot_keys_by_date[date]
+
+    def restore(self, lot):
+        key = self.popped_key
+        self.lots[key] = lot
+        self.lot_keys_by_date[lot.date].appendleft(key)
+        if not self.popped_key_in_order:
+            heapq.heappush(self.order, key)
+            self.popped_key_in_order = True
+
+    def get_lots(self):
+        return [self.lots[key] for key in sorted(self.lots)]
+
+    def __len__(self):
+        return len(self.lots)
+
+
+LOT_SELECTORS = {
+    "FIFO": FifoLotSelector,
+    "LIFO": LifoLotSelector,
+    "HIFO": HifoLotSelector,
+    "FIHO": HifoLotSelector,  # the name the highest cost selection used to go by
+    "SPECID": SpecificIdentificationLotSelector,
+}
+
+
+def get_lot_selector_factory(algorithm, designations=None):
+    algorithm = algorithm.upper()
+    if algorithm not in LOT_SELECTORS:
+        raise Exception("%s is not a valid algorithm" % algorithm)
+    if algorithm == "SPECID":
+        if designations is None:
+            raise Exception("SPECID requires lot designations")
+        return lambda: SpecificIdentificationLotSelector(designations)
+    return LOT_SELECTORS[algorithm]
+
+
+# format:
+# date, currency, lot date
+def read_lot_designations(file_name):
+    designations = collections.defaultdict(list)
+    with open(file_name, 'rb') as csv_file:
+        csv_designations = csv.reader(csv_file)
+        csv_designations.next()
+
+        for date, currency, lot_date in csv_designations:
+            designations[(Transaction.DATE_PARSER.parse(date), currency.lower())].append(
+                Transaction.DATE_PARSER.parse(lot_date))
+    return designations
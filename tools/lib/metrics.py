@@ -0,0 +1,128 @@
+"""
+Instrumentation shared by the command line tools: throttled progress output, per stage timings and counters, and an
+optional cProfile run. Tools add the flags with add_arguments and wrap their work in run_instrumented.
+"""
+
+import cProfile
+import json
+import sys
+import time
+
+
+class ProgressReporter:
+    """
+    Writes a progress line at most once per interval seconds. update is cheap enough to call for every row: the clock
+    is only read every check_every rows.
+    """
+    def __init__(self, label="Progress", interval=0.5, check_every=1000, stream=sys.stdout):
+        self.label = label
+        self.interval = interval
+        self.check_every = check_every
+        self.stream = stream
+        self.next_check = 0
+        self.next_write_time = 0
+
+    # fraction is the share of the work done, when it is unknown only the row count is shown
+    def update(self, rows, fraction=None):
+        if rows < self.next_check:
+            return
+        self.next_check = rows + self.check_every
+
+        now = time.time()
+        if now < self.next_write_time:
+            return
+        self.next_write_time = now + self.interval
+        self.write(rows, fraction)
+
+    def write(self, rows, fraction=None):
+        if fraction is None:
+            self.stream.write("%s: %d rows \r" % (self.label, rows))
+        else:
+            self.stream.write("%s: %d%% \r" % (self.label, 100.0 * fraction))
+        self.stream.flush()
+
+    def finish(self, rows, fraction=None):
+        self.write(rows, fraction)
+        self.stream.write("\n")
+        self.stream.flush()
+
+
+class Stage:
+    def __init__(self, metrics, name, rows):
+        self.metrics = metrics
+        self.name = name
+        self.rows = rows
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.add_stage(self.name, time.time() - self.start_time, self.rows)
+        return False
+
+
+class Metrics:
+    """
+    Collects wall time and rows per second of each stage a tool runs, plus any counters the tool sets, and saves them
+    as json.
+
+        with metrics.stage("read") as stage:
+            transactions = read()
+            stage.rows = len(transactions)
+    """
+    def __init__(self, tool):
+        self.tool = tool
+        self.stages = list()
+        self.counters = dict()
+        self.start_time = time.time()
+
+    def stage(self, name, rows=None):
+        return Stage(self, name, rows)
+
+    def add_stage(self, name, seconds, rows=None):
+        stage = {"name": name, "seconds": seconds}
+        if rows is not None:
+            stage["rows"] = rows
+            stage["rows_per_second"] = rows / seconds if seconds else 0
+        self.stages.append(stage)
+
+    def set(self, name, value):
+        self.counters[name] = value
+
+    def to_dict(self):
+        return {
+            "tool": self.tool,
+            "seconds": time.time() - self.start_time,
+            "stages": self.stages,
+            "counters": self.counters,
+        }
+
+    def write_to_file(self, file_name):
+        with open(file_name, 'w') as json_file:
+            json.dump(self.to_dict(), json_file, indent=2, sort_keys=True)
+
+
+def add_arguments(parser):
+    parser.add_argument('--metrics',
+                        help='path to save per stage timings, rows per second and counters to as json')
+    parser.add_argument('--profile',
+                        help='path to save cProfile statistics of the run to, readable with pstats')
+
+
+# calls function(metrics), profiling it when args.profile is set, and saves the metrics when args.metrics is set
+def run_instrumented(tool, args, function):
+    metrics = Metrics(tool)
+    if args.profile:
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(function, metrics)
+        finally:
+            profiler.dump_stats(args.profile)
+    else:
+        function(metrics)
+
+    if args.metrics:
+        metrics.write_to_file(args.metrics)
+    return metrics
@@ -0,0 +1,107 @@
+import collections
+import sqlite3
+import time
+
+
+class PriceCache:
+    """
+    Persistent store of historic prices keyed by ValueAdapter.get_currency_values_hash, i.e. (date, currency).
+
+    Prices are kept in a SQLite file so they survive between runs, with a bounded in-memory LRU in front of it.
+    Prices that could not be found are stored as NULL and returned as UNAVAILABLE, so they are not looked up again
+    until unavailable_ttl seconds have passed. The name of the price provider that found the price missing is kept with
+    it, so the price can still be looked up in other providers.
+    """
+    UNAVAILABLE = ''
+    DEFAULT_LRU_SIZE = 10000
+    DEFAULT_UNAVAILABLE_TTL = 30 * 24 * 60 * 60
+    COMMIT_INTERVAL = 100
+
+    def __init__(self, file_name=":memory:", lru_size=DEFAULT_LRU_SIZE, unavailable_ttl=DEFAULT_UNAVAILABLE_TTL):
+        self.connection = sqlite3.connect(file_name)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS prices ("
+                                "date TEXT NOT NULL, "
+                                "currency TEXT NOT NULL, "
+                                "price REAL, "
+                                "updated_at REAL NOT NULL, "
+                                "source TEXT, "
+                                "PRIMARY KEY (date, currency))")
+        # caches written before the source of unavailable prices was kept
+        if "source" not in [column[1] for column in self.connection.execute("PRAGMA table_info(prices)")]:
+            self.connection.execute("ALTER TABLE prices ADD COLUMN source TEXT")
+        self.connection.commit()
+        self.lru = collections.OrderedDict()
+        self.lru_size = lru_size
+        self.unavailable_ttl = unavailable_ttl
+        self.uncommitted_writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # returns the price, UNAVAILABLE if the price is known to be missing, or None if it has never been looked up
+    def get(self, currency_values_hash):
+        return self.get_with_source(currency_values_hash)[0]
+
+    # returns the price as get does and, for an UNAVAILABLE price, the name of the provider that found it missing,
+    # None when it is not known
+    def get_with_source(self, currency_values_hash):
+        if currency_values_hash in self.lru:
+            entry = self.lru.pop(currency_values_hash)
+            self.lru[currency_values_hash] = entry
+            self.hits += 1
+            return entry
+
+        date, currency = currency_values_hash
+        row = self.connection.execute("SELECT price, updated_at, source FROM prices WHERE date = ? AND currency = ?",
+                                      (date, currency)).fetchone()
+        if row is None or (row[0] is None and time.time() - row[1] > self.unavailable_ttl):
+            self.misses += 1
+            return None, None
+
+        entry = (self.UNAVAILABLE, row[2]) if row[0] is None else (row[0], None)
+        self.add_to_lru(currency_values_hash, entry)
+        self.hits += 1
+        return entry
+
+    # source is the name of the provider an UNAVAILABLE price was missing from
+    def set(self, currency_values_hash, price, source=None):
+        if price == self.UNAVAILABLE or price is None:
+            price = self.UNAVAILABLE
+        else:
+            price = float(price)
+            source = None
+
+        date, currency = currency_values_hash
+        self.connection.execute("INSERT OR REPLACE INTO prices (date, currency, price, updated_at, source) "
+                                "VALUES (?, ?, ?, ?, ?)",
+                                (date, currency, None if price == self.UNAVAILABLE else price, time.time(), source))
+        self.add_to_lru(currency_values_hash, (price, source))
+
+        self.uncommitted_writes += 1
+        if self.uncommitted_writes >= self.COMMIT_INTERVAL:
+            self.commit()
+
+    def add_to_lru(self, currency_values_hash, entry):
+        self.lru.pop(currency_values_hash, None)
+        self.lru[currency_values_hash] = entry
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def get_hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def get_stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.get_hit_rate(),
+            "lru_entries": len(self.lru)
+        }
+
+    def commit(self):
+        self.connection.commit()
+        self.uncommitted_writes = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
@@ -0,0 +1,202 @@
+"""
+Sources of historic USD prices and the chain that picks one for each lookup.
+
+A lookup is a (date, currency) pair with the date as "YYYY-MM-DD", the same key the price cache uses. Every provider
+declares its COST, the relative price of answering a lookup, and whether it is BATCH, answering any number of lookups
+in one go. PriceProviderChain asks providers cheapest first and only passes on the lookups the cheaper ones could not
+answer.
+"""
+
+from abc import ABCMeta, abstractmethod
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+
+import coin_market_cap_api
+import coinbase_api
+import collections
+import csv
+import math
+import sys
+
+
+class PriceProvider:
+    __metaclass__ = ABCMeta
+    NAME = None
+    COST = 0
+    BATCH = False
+    # whether a lookup this provider cannot answer is known to have no price, rather than just not being in its data
+    AUTHORITATIVE = False
+
+    @abstractmethod
+    def can_price(self, currency):
+        pass
+
+    # returns a lookup to price mapping of the lookups it has a price for
+    @abstractmethod
+    def get_prices(self, lookups):
+        pass
+
+
+class PriceFileProvider(PriceProvider):
+    """
+    Prices from a local csv of date, currency, price rows with a header row, for example saved by a previous download.
+    Needs no network, so it is what offline runs price with.
+    """
+    NAME = "price_file"
+    COST = 1
+    BATCH = True
+
+    def __init__(self, file_name):
+        self.prices = dict()
+        with open(file_name, 'rb') as csv_file:
+            csv_prices = csv.reader(csv_file)
+            csv_prices.next()
+
+            for date, currency, price in csv_prices:
+                self.prices[(date, currency.lower())] = float(price)
+        self.currencies = set(currency for _, currency in self.prices)
+
+    def can_price(self, currency):
+        return currency in self.currencies
+
+    def get_prices(self, lookups):
+        return dict((lookup, self.prices[lookup]) for lookup in lookups if lookup in self.prices)
+
+
+class CoinMarketCapPriceProvider(PriceProvider):
+    """
+    Downloads the daily prices of each currency over the whole range of its lookups in one CoinMarketCap request.
+    Downloads are kept and only repeated for lookups outside the range already downloaded. Requires numpy, see
+    price_series.
+    """
+    NAME = "coin_market_cap"
+    COST = 10
+    BATCH = True
+
+    def __init__(self, fill="none"):
+        self.fill = fill
+        # currency to (start date, end date, PriceSeries or None when CoinMarketCap had no prices)
+        self.downloads = dict()
+
+    def can_price(self, currency):
+        return currency in coin_market_cap_api.CURRENCY_SLUGS
+
+    def get_prices(self, lookups):
+        # imported here so that numpy is only needed when this provider is used
+        from price_series import load_price_series
+
+        dates_by_currency = collections.defaultdict(list)
+        for date, currency in lookups:
+            dates_by_currency[currency].append(datetime.strptime(date, "%Y-%m-%d").date())
+
+        prices = dict()
+        for currency, dates in dates_by_currency.items():
+            start_date, end_date, price_series = self.downloads.get(currency, (None, None, None))
+            if start_date is None or min(dates) < start_date or max(dates) > end_date:
+                start_date = min([min(dates)] + ([start_date] if start_date else []))
+                end_date = max([max(dates)] + ([end_date] if end_date else []))
+                price_series = load_price_series([currency], start_date, end_date, self.fill).get(currency)
+                self.downloads[currency] = (start_date, end_date, price_series)
+            if price_series is None:
+                continue
+            # one array gather per currency, NaN where the series has no price
+            for date, price in zip(dates, price_series.get_prices(dates)):
+                if not math.isnan(price):
+                    prices[(date.strftime("%Y-%m-%d"), currency)] = float(price)
+        return prices
+
+
+class CoinbasePriceProvider(PriceProvider):
+    """
+    Spot prices from the Coinbase api, one request per lookup.
+    """
+    NAME = "coinbase"
+    COST = 100
+    AUTHORITATIVE = True
+
+    def __init__(self, coinbase_client=None):
+        self.coinbase_client = coinbase_client if coinbase_client is not None else coinbase_api.default_client
+
+    def can_price(self, currency):
+        return coinbase_api.is_coinbase_price_available(currency)
+
+    def get_prices(self, lookups):
+        prices = dict()
+        for date, currency in lookups:
+            price = self.coinbase_client.get_historic_price(currency, date)
+            if price is not None:
+                prices[(date, currency)] = float(price)
+        return prices
+
+
+class PriceProviderChain:
+    """
+    Resolves lookups through providers from the cheapest to the most expensive. Providers that are not BATCH are asked
+    one lookup at a time from max_workers threads.
+    """
+    def __init__(self, providers):
+        self.providers = sorted(providers, key=lambda provider: provider.COST)
+        # number of lookups each provider answered
+        self.answered = collections.Counter()
+
+    def can_price(self, currency):
+        return any(provider.can_price(currency) for provider in self.providers)
+
+    # yields (lookup, price, None) for each lookup as soon as a provider answers it, so a lookup that fails later does
+    # not lose the prices found before it. Then yields (lookup, None, provider name) for the lookups that an
+    # AUTHORITATIVE provider had no price for and no other provider answered. The provider named excluded is not asked.
+    def get_prices(self, lookups, max_workers=1, excluded=None):
+        unavailable = dict()
+        remaining = set(lookups)
+        for provider in self.providers:
+            if provider.NAME == excluded:
+                continue
+            provider_lookups = sorted(lookup for lookup in remaining if provider.can_price(lookup[1]))
+            if not provider_lookups:
+                continue
+
+            for lookup, price in self.get_provider_prices(provider, provider_lookups, max_workers):
+                self.answered[provider.NAME] += 1
+                remaining.discard(lookup)
+                yield lookup, price, None
+            if provider.AUTHORITATIVE:
+                for lookup in provider_lookups:
+                    if lookup in remaining and lookup not in unavailable:
+                        unavailable[lookup] = provider.NAME
+
+        for lookup, provider_name in sorted(unavailable.items()):
+            if lookup in remaining:
+                yield lookup, None, provider_name
+
+    # yields (lookup, price) of the lookups the provider has a price for, one at a time as they are answered. A lookup
+    # that fails on a thread is raised once the other threads' prices are yielded.
+    @staticmethod
+    def get_provider_prices(provider, lookups, max_workers):
+        if provider.BATCH:
+            for lookup, price in sorted(provider.get_prices(lookups).items()):
+                yield lookup, price
+            return
+        if max_workers <= 1 or len(lookups) < 2:
+            for lookup in lookups:
+                for lookup_price in provider.get_prices([lookup]).items():
+                    yield lookup_price
+            return
+
+        def get_lookup_prices(lookup):
+            try:
+                return provider.get_prices([lookup]), None
+            except Exception:
+                return dict(), sys.exc_info()
+
+        error = None
+        pool = ThreadPool(min(max_workers, len(lookups)))
+        try:
+            for lookup_prices, lookup_error in pool.imap_unordered(get_lookup_prices, lookups):
+                error = error or lookup_error
+                for lookup_price in lookup_prices.items():
+                    yield lookup_price
+        finally:
+            pool.close()
+            pool.join()
+        if error is not None:
+            raise error[0], error[1], error[2]
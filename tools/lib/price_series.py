@@ -0,0 +1,76 @@
+import coin_market_cap_api
+
+try:
+    import numpy
+except ImportError:  # numpy is only needed for price series, everything else works without it
+    numpy = None
+
+
+class PriceSeries:
+    """
+    Daily USD prices of one currency held in a float64 array indexed by the number of days since start_date.
+
+    Days without a price are NaN unless filled. Looking up many days is a single array gather.
+    """
+    FILL_METHODS = ["none", "previous", "interpolate"]
+
+    def __init__(self, currency, start_date, prices):
+        if numpy is None:
+            raise Exception("numpy is required to use price series")
+        self.currency = currency
+        self.start_date = start_date
+        self.prices = numpy.asarray(prices, dtype=numpy.float64)
+
+    @classmethod
+    def from_daily_prices(cls, currency, daily_prices, fill="none"):
+        if numpy is None:
+            raise Exception("numpy is required to use price series")
+        if not daily_prices:
+            raise Exception("No prices found for %s" % currency)
+
+        dates = [date for date, _ in daily_prices]
+        start_date = min(dates)
+        prices = numpy.full((max(dates) - start_date).days + 1, numpy.nan)
+        for date, price in daily_prices:
+            prices[(date - start_date).days] = price
+
+        series = cls(currency, start_date, prices)
+        series.fill_missing_days(fill)
+        return series
+
+    def fill_missing_days(self, fill):
+        if fill not in self.FILL_METHODS:
+            raise Exception("%s is not a valid fill method" % fill)
+
+        missing = numpy.isnan(self.prices)
+        if fill == "none" or not missing.any() or missing.all():
+            return
+
+        days = numpy.arange(len(self.prices))
+        if fill == "previous":
+            # index of the last known price at or before each day, days before the first price stay NaN
+            last_known = numpy.maximum.accumulate(numpy.where(missing, -1, days))
+            self.prices = numpy.where(last_known >= 0, self.prices[numpy.maximum(last_known, 0)], numpy.nan)
+        else:
+            self.prices[missing] = numpy.interp(days[missing], days[~missing], self.prices[~missing])
+
+    def get_day_offsets(self, dates):
+        return numpy.array([(date - self.start_date).days for date in dates], dtype=numpy.int64)
+
+    # returns the price of every date, NaN where the series has no price
+    def get_prices(self, dates):
+        offsets = self.get_day_offsets(dates)
+        in_range = (offsets >= 0) & (offsets < len(self.prices))
+        prices = numpy.full(len(offsets), numpy.nan)
+        prices[in_range] = self.prices[offsets[in_range]]
+        return prices
+
+
+def load_price_series(currencies, start_date, end_date, fill="none"):
+    """
+    Download one range of daily prices per currency from CoinMarketCap, all currencies concurrently. Currencies it has
+    no prices for are skipped.
+    """
+    daily_prices = coin_market_cap_api.download_daily_prices(currencies, start_date, end_date)
+    return dict((currency, PriceSeries.from_daily_prices(currency, currency_prices, fill))
+                for currency, currency_prices in daily_prices.items())
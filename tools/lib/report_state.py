@@ -0,0 +1,86 @@
+"""
+Checkpoints of a tax report every interval transactions, so a report over mostly unchanged input only matches the
+transactions after the first change.
+
+The sidecar file is a SQLite database of checkpoints keyed by the number of transactions matched before it. Each holds
+the date of its last transaction, a digest of every transaction up to it and the report's open lots and totals in the
+checkpoint.py format. The digest chains the rows, so a checkpoint whose digest matches the new input was taken after
+exactly the same transactions in the same order and can be resumed from.
+
+Checkpoints are only valid for the configuration they were taken with, i.e. the algorithm and the files the report
+starts from. A sidecar of a different configuration is emptied.
+"""
+
+from checkpoint import checkpoint_from_bytes, checkpoint_to_bytes
+
+import hashlib
+import sqlite3
+
+DEFAULT_CHECKPOINT_INTERVAL = 10000
+
+
+# identifies the algorithm and the content of the files the report depends on besides its input
+def get_configuration(algorithm, *file_names):
+    configuration = [algorithm.upper()]
+    for file_name in file_names:
+        if file_name is None:
+            configuration.append("-")
+        else:
+            with open(file_name, 'rb') as configuration_file:
+                configuration.append(hashlib.sha1(configuration_file.read()).hexdigest())
+    return ",".join(configuration)
+
+
+class RowDigest:
+    """
+    Running digest of the transactions read so far.
+    """
+    def __init__(self):
+        self.digest = hashlib.sha1()
+
+    def update(self, transaction):
+        self.digest.update("%s,%s,%s,%d,%r\n" % (transaction.date, transaction.transaction_type, transaction.currency,
+                                                 transaction.units, transaction.value))
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+class ReportStateFile:
+    def __init__(self, file_name, configuration):
+        self.file_name = file_name
+        self.connection = sqlite3.connect(file_name)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS configuration (value TEXT NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS checkpoints ("
+                                "position INTEGER PRIMARY KEY, "
+                                "date TEXT NOT NULL, "
+                                "digest TEXT NOT NULL, "
+                                "state BLOB NOT NULL)")
+        row = self.connection.execute("SELECT value FROM configuration").fetchone()
+        if row is None or row[0] != configuration:
+            self.connection.execute("DELETE FROM configuration")
+            self.connection.execute("DELETE FROM checkpoints")
+            self.connection.execute("INSERT INTO configuration (value) VALUES (?)", (configuration,))
+        self.connection.commit()
+
+    # (position, digest) of every checkpoint, earliest first
+    def get_digests(self):
+        return self.connection.execute("SELECT position, digest FROM checkpoints ORDER BY position").fetchall()
+
+    # returns algorithm, totals and a currency to lots mapping, see checkpoint.read_checkpoint
+    def get_state(self, position):
+        state, = self.connection.execute("SELECT state FROM checkpoints WHERE position = ?", (position,)).fetchone()
+        return checkpoint_from_bytes(str(state), "%s at %d" % (self.file_name, position))
+
+    # drops the checkpoints taken after position, they belong to input that has changed
+    def truncate(self, position):
+        self.connection.execute("DELETE FROM checkpoints WHERE position > ?", (position,))
+
+    def add(self, position, date, digest, algorithm, totals, lots_by_currency):
+        self.connection.execute("INSERT OR REPLACE INTO checkpoints (position, date, digest, state) VALUES (?, ?, ?, ?)",
+                                (position, str(date), digest,
+                                 sqlite3.Binary(checkpoint_to_bytes(algorithm, totals, lots_by_currency))))
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,180 @@
+"""
+Synthetic exchange exports for benchmarks.
+
+Every generator writes rows in the header layout its converter in exchange_converter expects. Holdings are tracked
+per currency so no export sells more than it bought or was given in the opening balances, which keeps the
+consolidated history valid for a tax report.
+"""
+
+from datetime import datetime, timedelta
+from transaction import Transaction, write_transactions_to_file
+
+import csv
+import os
+import random
+import shutil
+
+START_DATE = datetime(2015, 1, 1)
+START_PRICES = {"btc": 300.0, "eth": 1.0}
+OPENING_BALANCES = {"btc": 1000.0, "eth": 100000.0}
+
+
+class SyntheticMarket:
+    def __init__(self, seed, opening_balances=None):
+        self.random = random.Random(seed)
+        self.date = START_DATE
+        self.prices = dict(START_PRICES)
+        self.holdings = dict((currency, 0.0) for currency in START_PRICES)
+        self.holdings.update(opening_balances or {})
+
+    # moves time forward and every price by a small random step
+    def step(self, max_seconds=3600):
+        self.date += timedelta(seconds=self.random.randint(1, max_seconds))
+        for currency in self.prices:
+            self.prices[currency] *= 1 + self.random.uniform(-0.01, 0.0105)
+
+    def get_trade_amount(self, currency):
+        held = self.holdings[currency]
+        if held > 0.1 and self.random.random() < 0.4:
+            return -round(self.random.uniform(0.01, 0.5) * held, 8)
+        return round(self.random.uniform(0.01, 2.0), 8)
+
+    def choose(self, options):
+        return self.random.choice(options)
+
+
+def write_gdax_export(file_name, rows, seed=0):
+    market = SyntheticMarket(seed)
+    with open(file_name, 'wb') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["type", "time", "amount", "balance", "currency", "transfer id", "trade id", "order id"])
+        written = 0
+        while written < rows:
+            market.step()
+            time = market.date.strftime("%Y-%m-%dT%H:%M:%S") + ".000Z"
+            amount = market.get_trade_amount("btc")
+            if market.holdings["btc"] == 0:
+                row_type = "deposit"
+            else:
+                row_type = "match"
+            market.holdings["btc"] += amount
+            writer.writerow([row_type, time, repr(amount), repr(market.holdings["btc"]), "BTC", "", written, written])
+            written += 1
+
+            fee = round(abs(amount) * 0.0025, 8)
+            if row_type == "match" and written < rows and fee < market.holdings["btc"]:
+                market.holdings["btc"] -= fee
+                writer.writerow(["fee", time, repr(-fee), repr(market.holdings["btc"]), "BTC", "", written, written])
+                written += 1
+
+
+def write_gemini_export(file_name, rows, seed=0):
+    market = SyntheticMarket(seed)
+    with open(file_name, 'wb') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["Date", "Time (UTC)", "Type", "Symbol", "Specification", "Liquidity Indicator",
+                         "Trading Fee Rate (bps)", "USD Amount", "Trading Fee (USD)", "USD Balance", "BTC Amount",
+                         "Trading Fee (BTC)", "BTC Balance", "ETH Amount", "ETH Balance", "Trade ID", "Order ID"])
+        for i in xrange(rows):
+            market.step()
+            currency = market.choose(["btc", "eth"])
+            amount = market.get_trade_amount(currency)
+            market.holdings[currency] += amount
+            usd_amount = -amount * market.prices[currency]
+
+            row = [market.date.strftime("%Y-%m-%d"), market.date.strftime("%H:%M:%S") + ".000",
+                   "Buy" if amount > 0 else "Sell", currency.upper() + "USD", "Limit", "Maker", "25",
+                   format_gemini_amount(usd_amount, "USD"), format_gemini_amount(-abs(usd_amount) * 0.0025, "USD"),
+                   "", "", "", "", "", "", i, i]
+            amount_index = 10 if currency == "btc" else 13
+            row[amount_index] = format_gemini_amount(amount, currency.upper())
+            writer.writerow(row)
+
+
+# example: "(0.5 BTC)" for negative amounts, "$1,234.56" for USD
+def format_gemini_amount(amount, currency):
+    if currency == "USD":
+        text = "${:,.2f}".format(abs(amount))
+    else:
+        text = "%.8f %s" % (abs(amount), currency)
+    return "(%s)" % text if amount < 0 else text
+
+
+def write_coinbase_export(file_name, rows, seed=0):
+    market = SyntheticMarket(seed)
+    with open(file_name, 'wb') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["Transactions"])
+        writer.writerow(["User", "benchmark", "0"])
+        writer.writerow(["Account", "BTC Wallet", "0"])
+        writer.writerow([])
+        writer.writerow(["Timestamp", "Balance", "Amount", "Currency", "To", "Notes", "Instantly Exchanged",
+                         "Transfer Total", "Transfer Total Currency", "Transfer Fee", "Transfer Fee Currency",
+                         "Transfer Payment Method", "Transfer ID"])
+        for i in xrange(rows):
+            market.step()
+            amount = market.get_trade_amount("btc")
+            market.holdings["btc"] += amount
+            if amount > 0:
+                total = amount * market.prices["btc"]
+                transfer = ["%.2f" % total, "USD", "%.2f" % (total * 0.0149), "USD", "bank"]
+            else:
+                transfer = ["", "", "", "", ""]
+            writer.writerow([market.date.strftime("%Y-%m-%d %H:%M:%S") + " -0700", repr(market.holdings["btc"]),
+                             repr(amount), "BTC", "", "", "false"] + transfer + [i])
+
+
+def write_binance_export(file_name, rows, seed=0, chunk_size=100000):
+    # a trade history alone never shows where the first coins came from, so binance trades from opening balances
+    market = SyntheticMarket(seed, OPENING_BALANCES)
+
+    # binance exports newest first, so chunks are written reversed to temporary files and joined in reverse
+    chunk_file_names = list()
+    for chunk_start in xrange(0, rows, chunk_size):
+        trades = list()
+        for _ in xrange(min(chunk_size, rows - chunk_start)):
+            trades.append(get_binance_trade(market))
+        chunk_file_names.append("%s.%d" % (file_name, len(chunk_file_names)))
+        with open(chunk_file_names[-1], 'wb') as chunk_file:
+            csv.writer(chunk_file).writerows(reversed(trades))
+
+    with open(file_name, 'wb') as csv_file:
+        csv.writer(csv_file).writerow(["Date", "Market", "Type", "Price", "Amount", "Total", "Fee", "Fee Coin"])
+        for chunk_file_name in reversed(chunk_file_names):
+            with open(chunk_file_name, 'rb') as chunk_file:
+                shutil.copyfileobj(chunk_file, csv_file)
+            os.remove(chunk_file_name)
+
+
+def get_binance_trade(market):
+    market.step()
+    # ETHBTC: ETH is bought and sold for BTC, at most a percent of the holdings at a time
+    price = market.prices["eth"] / market.prices["btc"]
+    if market.random.random() < 0.5:
+        trade_type = "BUY"
+        amount = round(market.random.uniform(0.001, 0.01) * market.holdings["btc"] / price, 8)
+        market.holdings["eth"] += amount
+        market.holdings["btc"] -= amount * price
+    else:
+        trade_type = "SELL"
+        amount = round(market.random.uniform(0.001, 0.01) * market.holdings["eth"], 8)
+        market.holdings["eth"] -= amount
+        market.holdings["btc"] += amount * price
+    return [market.date.strftime("%Y-%m-%d %H:%M:%S"), "ETHBTC", trade_type, "%.8f" % price, "%.8f" % amount,
+            "%.8f" % (amount * price), "%.8f" % (amount * 0.001), "BNB"]
+
+
+# standard transactions holding the OPENING_BALANCES, bought the day before the synthetic history starts
+def write_opening_balances(file_name):
+    write_transactions_to_file([Transaction(START_DATE - timedelta(days=1), "transfer", currency, amount,
+                                            START_PRICES[currency])
+                                for currency, amount in sorted(OPENING_BALANCES.items())],
+                               file_name)
+
+
+EXPORT_WRITERS = {
+    "gdax": write_gdax_export,
+    "gemini": write_gemini_export,
+    "coinbase": write_coinbase_export,
+    "binance": write_binance_export,
+}
@@ -1,89 +1,302 @@
-from datetime import timedelta
-from transaction import write_transactions_to_file
+from checkpoint import read_checkpoint, write_checkpoint
+from disposals import DisposalRecords
+from lot_selection import get_lot_selector_factory
+from metrics import ProgressReporter
+from report_state import DEFAULT_CHECKPOINT_INTERVAL, RowDigest
+from transaction import Transaction, write_transactions_to_file
 
 import collections
+import csv
+import multiprocessing
 import sys
-import heapq
 
 
 class TaxReport:
 
-    def __init__(self, transactions, algorithm):
-        # currency to priority queue mapping
-        self.heapq_transactions_dict = collections.defaultdict(list)
-        self.short_term_proceeds = 0
-        self.short_term_cost_basis = 0
-        self.long_term_proceeds = 0
-        self.long_term_cost_basis = 0
-        self.fees = 0
+    # transactions can be any iterable ordered by date, only open lots are kept in memory
+    # lot_designations are only used by the SPECID algorithm, see lot_selection.read_lot_designations
+    def __init__(self, transactions, algorithm, lot_designations=None):
+        # currency to open lots mapping, the lot selector decides which lot is sold next
+        self.open_lots_dict = collections.defaultdict(get_lot_selector_factory(algorithm, lot_designations))
+        self.lot_designations = lot_designations
+        # every lot matched against a sale or fee, the totals are computed from these
+        self.disposals = DisposalRecords()
+        # totals carried over from a checkpoint plus the totals of the first summarized_disposals disposals, so
+        # get_totals only adds up the disposals made since it was last called
+        self.carried_totals = [0, 0, 0, 0, 0]
+        self.summarized_disposals = 0
         self.currency_values_cache = dict()
         self.transactions = transactions
         self.algorithm = algorithm
+        # number of lots handed to and taken from the lot selectors
+        self.lot_pushes = 0
+        self.lot_pops = 0
+        # number of transactions process_transactions_incrementally took from a checkpoint instead of matching them
+        self.resumed_from = 0
+        # holdings_index.HoldingsIndexWriter every change to the open lots is recorded to, if any
+        self.holdings_index = None
+        # lot_compaction.LotCompactor merging lots that are sold the same way, if any
+        self.lot_compactor = None
 
-    def generate_tax_report(self, export_file):
-        for i, transaction in enumerate(self.transactions):
-            if transaction.is_taxable():
+    def generate_tax_report(self, export_file, processes=1):
+        if processes > 1:
+            self.process_transactions_in_parallel(processes)
+        else:
+            self.process_transactions()
+        self.write_tax_report(export_file)
+
+    # returns the number of transactions processed
+    def process_transactions(self, show_progress=True):
+        progress = ProgressReporter() if show_progress else None
+        i = 0
+        for i, transaction in enumerate(self.transactions, 1):
+            self.process_transaction(transaction)
+            if progress is not None:
+                progress.update(i, self.get_progress(i))
+        if progress is not None:
+            progress.finish(i, self.get_progress(i))
+        return i
+
+    # like process_transactions, but resumes from the last checkpoint of report_state.ReportStateFile state_file that
+    # was taken after the same transactions as the input, and saves a checkpoint every interval transactions after it.
+    # Transactions read since the last matching checkpoint are held until the next one is checked, so the input is
+    # only read once.
+    def process_transactions_incrementally(self, state_file, interval=DEFAULT_CHECKPOINT_INTERVAL,
+                                           show_progress=True):
+        progress = ProgressReporter() if show_progress else None
+        checkpoints = collections.deque(state_file.get_digests())
+        row_digest = RowDigest()
+        # (position, transaction, digest) read since the last matching checkpoint
+        pending = list()
+
+        i = 0
+        for i, transaction in enumerate(self.transactions, 1):
+            row_digest.update(transaction)
+            digest = None
+            if i % interval == 0 or (checkpoints and i == checkpoints[0][0]):
+                digest = row_digest.hexdigest()
+
+            if not checkpoints:
+                self.process_checkpointed_transaction(state_file, i, transaction, digest, interval)
+            else:
+                pending.append((i, transaction, digest))
+                if i == checkpoints[0][0]:
+                    position, checkpoint_digest = checkpoints.popleft()
+                    if checkpoint_digest == digest:
+                        self.resumed_from = position
+                        pending = list()
+                    else:
+                        checkpoints.clear()
+                    if not checkpoints:
+                        self.resume_state(state_file, pending, interval)
+            if progress is not None:
+                progress.update(i, self.get_progress(i))
+        if checkpoints:
+            self.resume_state(state_file, pending, interval)
+        if progress is not None:
+            progress.finish(i, self.get_progress(i))
+        return i
+
+    # restores the last matching checkpoint and matches the transactions held since
+    def resume_state(self, state_file, pending, interval):
+        state_file.truncate(self.resumed_from)
+        if self.resumed_from:
+            self.load_state(*state_file.get_state(self.resumed_from))
+        for i, transaction, digest in pending:
+            self.process_checkpointed_transaction(state_file, i, transaction, digest, interval)
+
+    def process_checkpointed_transaction(self, state_file, i, transaction, digest, interval):
+        self.process_transaction(transaction)
+        if i % interval == 0:
+            state_file.add(i, transaction.date, digest, self.algorithm, self.get_totals(), self.get_lots_by_currency())
+
+    def process_transaction(self, transaction):
+        if transaction.is_taxable():
+            self.resolve_taxable_transaction(transaction)
+        else:
+            self.add_open_lot(transaction)
+
+    # lot matching only ever looks at one currency, so every currency is matched in its own process and only the
+    # totals are combined. Each currency's transactions are held in memory until its process picks them up.
+    def process_transactions_in_parallel(self, processes=None):
+        transaction_rows_dict = collections.defaultdict(list)
+        i = 0
+        for i, transaction in enumerate(self.transactions, 1):
+            if transaction.currency == "usd" and transaction.is_fee():
                 self.resolve_taxable_transaction(transaction)
             else:
-                self.add_non_taxable_transaction_to_heapq(transaction)
-            sys.stdout.write("Progress: %d%% \r" % (100.0*i/len(self.transactions)))
-            sys.stdout.flush()
+                transaction_rows_dict[transaction.currency].append(transaction.get_row())
+
+        # largest currencies first so one big currency does not start last
+        tasks = list()
+        for currency, transaction_rows in sorted(transaction_rows_dict.items(), key=lambda x: -len(x[1])):
+            lot_designations = None
+            if self.lot_designations is not None:
+                lot_designations = dict((key, lot_dates) for key, lot_dates in self.lot_designations.items()
+                                        if key[1] == currency)
+            open_lot_rows = [lot.get_row() for lot in self.open_lots_dict[currency].get_lots()]
+            tasks.append((self.algorithm, lot_designations, currency, open_lot_rows, transaction_rows))
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            for j, (currency, disposals, open_lot_rows, lot_pushes, lot_pops) in enumerate(
+                    pool.imap_unordered(process_currency, tasks)):
+                self.disposals.extend(disposals)
+                self.lot_pushes += lot_pushes
+                self.lot_pops += lot_pops
+                del self.open_lots_dict[currency]
+                # the worker already counted these lots when it first pushed them
+                lot_selector = self.open_lots_dict[currency]
+                for row in open_lot_rows:
+                    lot_selector.push(Transaction(*row))
+                sys.stdout.write("Progress: %d of %d currencies \r" % (j + 1, len(tasks)))
+                sys.stdout.flush()
+        finally:
+            pool.close()
+            pool.join()
+        return i
 
+    def write_tax_report(self, export_file):
+        short_term_proceeds, short_term_cost_basis, long_term_proceeds, long_term_cost_basis, fees = \
+            self.get_totals()
         writer = write_transactions_to_file(self.get_remaining_transactions(), export_file)
 
         # print remaining data
         writer.writerow([])
-        writer.writerow(["Short term proceeds", self.short_term_proceeds])
-        writer.writerow(["Short term cost basis", self.short_term_cost_basis])
-        writer.writerow(["Short term capital gains", self.short_term_proceeds - self.short_term_cost_basis])
-        writer.writerow(["Long term proceeds", self.long_term_proceeds])
-        writer.writerow(["Long term cost basis", self.long_term_cost_basis])
-        writer.writerow(["Long term capital gains", self.long_term_proceeds - self.long_term_cost_basis])
-        writer.writerow(["Fees paid", self.fees])
+        writer.writerow(["Short term proceeds", short_term_proceeds])
+        writer.writerow(["Short term cost basis", short_term_cost_basis])
+        writer.writerow(["Short term capital gains", short_term_proceeds - short_term_cost_basis])
+        writer.writerow(["Long term proceeds", long_term_proceeds])
+        writer.writerow(["Long term cost basis", long_term_cost_basis])
+        writer.writerow(["Long term capital gains", long_term_proceeds - long_term_cost_basis])
+        writer.writerow(["Fees paid", fees])
+
+    # fraction of the transactions processed, or None when the total is unknown
+    def get_progress(self, processed):
+        if hasattr(self.transactions, "get_progress"):
+            return self.transactions.get_progress()
+        elif hasattr(self.transactions, "__len__"):
+            return float(processed) / len(self.transactions) if len(self.transactions) else 1.0
+        return None
 
     def resolve_taxable_transaction(self, transaction):
         if transaction.currency == "usd" and transaction.transaction_type == "fee":
-            self.fees += abs(transaction.amount)
+            self.disposals.append(transaction.date, transaction.date, abs(transaction.units), 1.0, '', "usd", True)
             return
 
-        while transaction.amount < 0:
-            _, prev_transaction = heapq.heappop(self.heapq_transactions_dict[transaction.currency])
-            self.update_capital_gains(prev_transaction, transaction)
-            self.decrement_transaction_amounts(prev_transaction, transaction)
+        # neither the transaction nor its lots are changed, a partly sold lot is restored as a copy holding the
+        # remainder, so other reports can match the same transactions, see ScenarioReport. Amounts are matched in
+        # integer base units, so they add up exactly.
+        units = transaction.units
+        while units < 0:
+            lot = self.open_lots_dict[transaction.currency].pop(transaction)
+            self.lot_pops += 1
+            self.update_capital_gains(lot, transaction, min(lot.units, -units))
+            if self.holdings_index is not None:
+                self.holdings_index.record(transaction.date, lot, -min(lot.units, -units))
+            units = self.decrement_transaction_amounts(lot, units)
 
-    def decrement_transaction_amounts(self, prev_transaction, transaction):
-        if prev_transaction.amount + transaction.amount > 0:
-            prev_transaction.amount += transaction.amount
-            transaction.amount = 0
-            self.add_non_taxable_transaction_to_heapq(prev_transaction)
-        else:
-            transaction.amount += prev_transaction.amount
+    # returns the base units of the transaction still to be matched
+    def decrement_transaction_amounts(self, prev_transaction, units):
+        if prev_transaction.units + units > 0:
+            self.open_lots_dict[prev_transaction.currency].restore(
+                prev_transaction.with_units(prev_transaction.units + units))
+            self.lot_pushes += 1
+            return 0
+        return units + prev_transaction.units
 
-    def update_capital_gains(self, prev_transaction, transaction):
-        min_transaction_amount = min(prev_transaction.amount, abs(transaction.amount))
-        if transaction.is_fee(): # no usd transactions at this point
-            self.fees += abs(min_transaction_amount*prev_transaction.value)
-        else:
-            total_proceeds = min_transaction_amount * transaction.value
-            cost_basis = min_transaction_amount * prev_transaction.value
-            if transaction.date > prev_transaction.date + timedelta(days=365):
-                self.long_term_proceeds += total_proceeds
-                self.long_term_cost_basis += cost_basis
-            else:
-                self.short_term_proceeds += total_proceeds
-                self.short_term_cost_basis += cost_basis
+    # gains cannot be computed without both values, only a fee has no proceeds
+    def update_capital_gains(self, prev_transaction, transaction, units):
+        if prev_transaction.value == '':
+            raise Exception("%s lot of %s has no value, the cost basis of the %s %s on %s cannot be computed" %
+                            (transaction.currency, prev_transaction.date, transaction.currency,
+                             transaction.transaction_type, transaction.date))
+        if transaction.value == '' and not transaction.is_fee():
+            raise Exception("%s %s on %s has no value, its proceeds cannot be computed" %
+                            (transaction.currency, transaction.transaction_type, transaction.date))
+        self.disposals.append(prev_transaction.date,
+                              transaction.date,
+                              units,
+                              prev_transaction.value,
+                              transaction.value,
+                              transaction.currency,
+                              transaction.is_fee())
+
+    def add_open_lot(self, transaction):
+        self.open_lots_dict[transaction.currency].push(transaction)
+        self.lot_pushes += 1
+        if self.holdings_index is not None:
+            self.holdings_index.record(transaction.date, transaction, transaction.units)
+        if self.lot_compactor is not None and \
+                self.lot_compactor.is_due(transaction.currency, len(self.open_lots_dict[transaction.currency])):
+            self.compact_lots(transaction.currency, transaction.date)
+
+    def compact_lots(self, currency, date):
+        lot_selector = self.open_lots_dict[currency]
+        lots, merges = self.lot_compactor.compact(date, currency, lot_selector.get_selection_order())
+        if not merges:
+            return
+        lot_selector.set_selection_order(lots)
+        if self.holdings_index is not None:
+            for lots, merged_lot in merges:
+                for lot in lots:
+                    self.holdings_index.record(date, lot, -lot.units)
+                self.holdings_index.record(date, merged_lot, merged_lot.units)
 
-    def add_non_taxable_transaction_to_heapq(self, transaction):
-        heapq.heappush(self.heapq_transactions_dict[transaction.currency], (-transaction.value, transaction))
+    # lot selector activity and the open lots left per currency, for metrics.Metrics
+    def get_metrics(self):
+        return {
+            "lot_pushes": self.lot_pushes,
+            "lot_pops": self.lot_pops,
+            "disposals": len(self.disposals),
+            "open_lots": dict((currency, len(lot_selector))
+                              for currency, lot_selector in self.open_lots_dict.items() if len(lot_selector)),
+        }
 
     def get_remaining_transactions(self):
         remaining_transactions = list()
-        for transactions in self.heapq_transactions_dict.values():
-            remaining_transactions.extend([tx for key, tx in transactions])
+        for lot_selector in self.open_lots_dict.values():
+            remaining_transactions.extend(lot_selector.get_lots())
 
         remaining_transactions.sort(key=lambda x: x.date)
         return remaining_transactions
 
+    # returns short term proceeds, short term cost basis, long term proceeds, long term cost basis and fees
+    def get_totals(self):
+        self.carried_totals = self.disposals.summarize(self.carried_totals, self.summarized_disposals)
+        self.summarized_disposals = len(self.disposals)
+        return list(self.carried_totals)
+
+    # a new tax year starts from the previous year's open lots but not its gains
+    def reset_totals(self):
+        self.carried_totals = [0, 0, 0, 0, 0]
+        self.summarized_disposals = 0
+        self.disposals = DisposalRecords()
+
+    def save_checkpoint(self, file_name):
+        write_checkpoint(file_name, self.algorithm, self.get_totals(), self.get_lots_by_currency())
+
+    def load_checkpoint(self, file_name):
+        self.load_state(*read_checkpoint(file_name))
+
+    # open lots in selection order per currency
+    def get_lots_by_currency(self):
+        return dict((currency, lot_selector.get_lots())
+                    for currency, lot_selector in self.open_lots_dict.items() if len(lot_selector))
+
+    def load_state(self, algorithm, totals, lots_by_currency):
+        # totals nothing was added to are saved as 0.0 but reported as 0
+        self.carried_totals = [total if total else 0 for total in totals]
+        self.summarized_disposals = 0
+        self.disposals = DisposalRecords()
+        self.open_lots_dict.clear()
+        for currency, lots in lots_by_currency.items():
+            # lots are saved in selection order, which is only purchase order for the algorithm that saved them
+            if algorithm.upper() != self.algorithm.upper():
+                lots.sort(key=lambda x: x.date)
+            for lot in lots:
+                self.add_open_lot(lot)
+
     # testing
     def calculate_sum(self):
         eth_value = 0
@@ -96,3 +309,84 @@ class TaxReport:
         print eth_value
         print btc_value
 
+
+class ScenarioReport:
+    """
+    Matches the same transactions with several algorithms in a single pass to compare their gains.
+
+    Every transaction is read once and handed to one TaxReport per algorithm. Lots are shared between the reports since
+    matching never changes them; only a partly sold lot is copied, by the report that sold it.
+    """
+    COMPARISON_HEADER = ["Algorithm", "Short term proceeds", "Short term cost basis", "Short term capital gains",
+                         "Long term proceeds", "Long term cost basis", "Long term capital gains", "Fees paid",
+                         "Total capital gains", "Open lots"]
+
+    def __init__(self, transactions, algorithms, lot_designations=None):
+        self.transactions = transactions
+        self.tax_reports = collections.OrderedDict()
+        for algorithm in algorithms:
+            algorithm = algorithm.upper()
+            if algorithm not in self.tax_reports:
+                self.tax_reports[algorithm] = TaxReport(transactions, algorithm, lot_designations)
+
+    # returns the number of transactions processed
+    def process_transactions(self, show_progress=True):
+        progress = ProgressReporter() if show_progress else None
+        tax_reports = self.tax_reports.values()
+        i = 0
+        for i, transaction in enumerate(self.transactions, 1):
+            for tax_report in tax_reports:
+                tax_report.process_transaction(transaction)
+            if progress is not None:
+                progress.update(i, tax_reports[0].get_progress(i))
+        if progress is not None:
+            progress.finish(i, tax_reports[0].get_progress(i))
+        return i
+
+    # every algorithm starts from the same checkpoint, reordered for its own lot selection
+    def load_checkpoint(self, file_name):
+        for tax_report in self.tax_reports.values():
+            tax_report.load_checkpoint(file_name)
+
+    def reset_totals(self):
+        for tax_report in self.tax_reports.values():
+            tax_report.reset_totals()
+
+    def get_comparison_rows(self):
+        rows = list()
+        for algorithm, tax_report in self.tax_reports.items():
+            short_term_proceeds, short_term_cost_basis, long_term_proceeds, long_term_cost_basis, fees = \
+                tax_report.get_totals()
+            short_term_gains = short_term_proceeds - short_term_cost_basis
+            long_term_gains = long_term_proceeds - long_term_cost_basis
+            open_lots = sum(len(lot_selector) for lot_selector in tax_report.open_lots_dict.values())
+            rows.append([algorithm, short_term_proceeds, short_term_cost_basis, short_term_gains, long_term_proceeds,
+                         long_term_cost_basis, long_term_gains, fees, short_term_gains + long_term_gains, open_lots])
+        return rows
+
+    def write_comparison(self, export_file):
+        with open(export_file, 'wb') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(self.COMPARISON_HEADER)
+            writer.writerows(self.get_comparison_rows())
+
+    def print_comparison(self):
+        print(" | ".join(self.COMPARISON_HEADER))
+        for row in self.get_comparison_rows():
+            print(" | ".join([row[0]] + ["%.2f" % value for value in row[1:-1]] + [str(row[-1])]))
+
+    def get_metrics(self):
+        return {"algorithms": dict((algorithm, tax_report.get_metrics())
+                                   for algorithm, tax_report in self.tax_reports.items())}
+
+
+# runs in a worker process, transactions and lots are passed as rows to keep them cheap to pickle
+def process_currency(task):
+    algorithm, lot_designations, currency, open_lot_rows, transaction_rows = task
+    tax_report = TaxReport([Transaction(*row) for row in transaction_rows], algorithm, lot_designations)
+    for row in open_lot_rows:
+        tax_report.add_open_lot(Transaction(*row))
+
+    tax_report.process_transactions(show_progress=False)
+    return currency, tax_report.disposals, [lot.get_row() for lot in tax_report.open_lots_dict[currency].get_lots()], \
+        tax_report.lot_pushes, tax_report.lot_pops
@@ -1,32 +1,43 @@
 from datetime import datetime
+from date_parser import DateParser
+from fixed_point import check_units, from_units, to_exact_amount, to_units
 
+import copy
 import csv
+import os
 
 
 class Transaction:
     VALID_TRANSACTION_TYPES = ["trade", "transfer", "fee"]
     VALID_DATE_FORMATS = ["%Y-%m-%d %H:%M:%S", "%m/%d/%y  %H:%M"]
+    DATE_PARSER = DateParser(VALID_DATE_FORMATS)
 
     def __init__(self, date, transaction_type, currency, amount, value=""):
         if transaction_type.lower() not in self.VALID_TRANSACTION_TYPES:
             raise Exception("%s is not a valid transaction type" % transaction_type)
         # example: "10/14/2017  11:13:57 PM"
         if type(date) is str:
-            for fmt in self.VALID_DATE_FORMATS:
-                try:
-                    date = datetime.strptime(date, fmt)
-                    break
-                except ValueError:
-                    continue
-            if type(date) is str:
+            try:
+                date = self.DATE_PARSER.parse(date)
+            except ValueError:
                 raise Exception("None of the datetime formats were valid")
 
         self.date = date
         self.transaction_type = transaction_type.lower()
         self.currency = currency.lower()
-        self.amount = float(amount)
+        # amounts are kept in integer base units, see fixed_point
+        self.units = to_units(amount)
+        self.amount = from_units(self.units)
         self.value = abs(float(value)) if value else value
 
+    # a transaction of an amount already in base units, such as one read back from a binary file
+    @classmethod
+    def from_units(cls, date, transaction_type, currency, units, value=""):
+        transaction = cls(date, transaction_type, currency, 0, value)
+        transaction.units = check_units(int(units))
+        transaction.amount = from_units(transaction.units)
+        return transaction
+
     @staticmethod
     def get_header_row():
         return ["Date", "Transaction Type", "Currency", "Amount", "Value"]
@@ -41,19 +52,53 @@ class Transaction:
         return datetime.strftime(self.date, "%Y-%m-%d")
 
     def get_row(self):
-        return [self.date, self.transaction_type, self.currency, self.amount, self.value]
+        return [self.date, self.transaction_type, self.currency, to_exact_amount(self.units), self.value]
+
+    # a copy holding a different amount in base units, so a partly sold lot can be handed back without changing the
+    # shared original
+    def with_units(self, units):
+        transaction = copy.copy(self)
+        transaction.units = check_units(units)
+        transaction.amount = from_units(units)
+        return transaction
 
 
 def get_transactions_from_file(file_name):
-    transactions = list()
-    with open(file_name, 'rb') as csv_file:
-        csv_standard_exchange_transactions = csv.reader(csv_file)
-        csv_standard_exchange_transactions.next()
+    return list(iter_transactions_from_file(file_name))
+
+
+# reads one transaction at a time so callers can stream files of any size
+def iter_transactions_from_file(file_name):
+    return iter(TransactionFileReader(file_name))
+
+
+class TransactionFileReader:
+    """
+    Lazily iterates the transactions of a standard transaction file, tracking how much of the file has been read.
+    Every iteration re-reads the file from the start.
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.total_bytes = os.path.getsize(file_name)
+        self.bytes_read = 0
+
+    def __iter__(self):
+        self.bytes_read = 0
+        with open(self.file_name, 'rb') as csv_file:
+            csv_standard_exchange_transactions = csv.reader(self.count_bytes_read(csv_file))
+            csv_standard_exchange_transactions.next()
+
+            for row in csv_standard_exchange_transactions:
+                yield Transaction(*row)
 
-        for row in csv_standard_exchange_transactions:
-            transactions.append(Transaction(*row))
+    def count_bytes_read(self, lines):
+        for line in lines:
+            self.bytes_read += len(line)
+            yield line
 
-    return transactions
+    # fraction of the file read so far
+    def get_progress(self):
+        return float(self.bytes_read) / self.total_bytes if self.total_bytes else 1.0
 
 
 def write_transactions_to_file(transactions, file_name):
@@ -0,0 +1,69 @@
+from binary_format import open_transaction_file, write_binary_transactions
+
+import heapq
+import itertools
+import os
+import shutil
+import tempfile
+
+DEFAULT_CHUNK_SIZE = 100000
+
+
+def merge_transaction_files(file_names, chunk_size=DEFAULT_CHUNK_SIZE, assume_sorted=False):
+    """
+    Lazily merge standard transaction files into one stream ordered by date.
+
+    Files already ordered by date are merged directly, anything else is first split into sorted runs of at most
+    chunk_size transactions in a temporary directory. Transactions with the same date keep the order they would have
+    after concatenating the files and sorting them, and only one transaction per run is held in memory.
+    """
+    temp_dir = tempfile.mkdtemp(prefix="crypto_taxes_")
+    try:
+        runs = list()
+        for file_name in file_names:
+            if assume_sorted or is_sorted_by_date(open_transaction_file(file_name)):
+                runs.append(file_name)
+            else:
+                runs.extend(write_sorted_runs(file_name, chunk_size, temp_dir))
+
+        for transaction in merge_sorted([open_transaction_file(run) for run in runs]):
+            yield transaction
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def merge_sorted(sorted_transaction_iterables):
+    keyed_iterables = [get_keyed_transactions(run_index, transactions)
+                       for run_index, transactions in enumerate(sorted_transaction_iterables)]
+    for _, transaction in heapq.merge(*keyed_iterables):
+        yield transaction
+
+
+# (date, run, position) keys are unique, so heapq never has to compare two transactions
+def get_keyed_transactions(run_index, transactions):
+    for position, transaction in enumerate(transactions):
+        yield (transaction.date, run_index, position), transaction
+
+
+def is_sorted_by_date(transactions):
+    previous_date = None
+    for transaction in transactions:
+        if previous_date is not None and transaction.date < previous_date:
+            return False
+        previous_date = transaction.date
+    return True
+
+
+def write_sorted_runs(file_name, chunk_size, temp_dir):
+    run_file_names = list()
+    transactions = iter(open_transaction_file(file_name))
+    while True:
+        chunk = list(itertools.islice(transactions, chunk_size))
+        if not chunk:
+            return run_file_names
+
+        chunk.sort(key=lambda x: x.date)
+        # runs are only read back by the merge, so they skip csv parsing
+        run_file_name = os.path.join(temp_dir, "run_%d.bin" % len(os.listdir(temp_dir)))
+        write_binary_transactions(chunk, run_file_name)
+        run_file_names.append(run_file_name)
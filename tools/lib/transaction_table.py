@@ -0,0 +1,211 @@
+from array import array
+from datetime import datetime, timedelta
+from fixed_point import UNITS_TYPECODE, from_units, to_exact_amount, to_units
+from itertools import compress, izip
+from transaction import Transaction
+
+EPOCH = datetime(1970, 1, 1)
+NAN = float("nan")
+FEE_TYPE_CODE = Transaction.VALID_TRANSACTION_TYPES.index("fee")
+
+
+class TransactionTable(object):
+    """
+    Column oriented storage for transactions.
+
+    Dates are epoch seconds, amounts are integer base units (see fixed_point), values are doubles (NaN when the value
+    is unknown) and currencies and transaction types are small integer codes, which takes a few tens of bytes per
+    transaction instead of a full Transaction instance. Iterating or indexing the table returns TransactionRow views
+    that behave like Transactions.
+
+    Converters that write both sides of a trade give the two rows the same pair id, see cross_rates.find_pair_trades.
+    Pair ids are only kept while converting and are not saved, tables without pairs have no pair_ids column.
+    """
+
+    def __init__(self):
+        self.dates = array('l')
+        self.amounts = array(UNITS_TYPECODE)
+        self.values = array('d')
+        self.currency_codes = array('H')
+        self.type_codes = array('B')
+        self.currencies = list()
+        self.currency_to_code = dict()
+        self.pair_ids = None
+        self.next_pair_id = 1
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        table = cls()
+        table.extend(transactions)
+        return table
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transaction index out of range")
+        return TransactionRow(self, index)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield TransactionRow(self, index)
+
+    def get_currency_code(self, currency):
+        code = self.currency_to_code.get(currency)
+        if code is None:
+            code = len(self.currencies)
+            self.currencies.append(currency)
+            self.currency_to_code[currency] = code
+        return code
+
+    # the id to append both sides of a new pair trade with
+    def new_pair_id(self):
+        self.get_pair_ids()
+        self.next_pair_id += 1
+        return self.next_pair_id - 1
+
+    # the pair ids column, added on first use with no pair for the rows before
+    def get_pair_ids(self):
+        if self.pair_ids is None:
+            self.pair_ids = array('l', [0]) * len(self)
+        return self.pair_ids
+
+    def append(self, transaction, pair_id=0):
+        if self.pair_ids is not None:
+            self.pair_ids.append(pair_id)
+        self.dates.append(to_timestamp(transaction.date))
+        self.amounts.append(transaction.units)
+        self.values.append(to_stored_value(transaction.value))
+        self.currency_codes.append(self.get_currency_code(transaction.currency))
+        self.type_codes.append(Transaction.VALID_TRANSACTION_TYPES.index(transaction.transaction_type))
+
+    def extend(self, transactions):
+        for transaction in transactions:
+            self.append(transaction)
+
+    # appends another table column by column, remapping its currency codes to this table's
+    def extend_table(self, table):
+        codes = [self.get_currency_code(currency) for currency in table.currencies]
+        if table.pair_ids is not None:
+            offset = self.next_pair_id - 1
+            self.get_pair_ids().extend(array('l', [pair_id + offset if pair_id else 0 for pair_id in table.pair_ids]))
+            self.next_pair_id += table.next_pair_id - 1
+        elif self.pair_ids is not None:
+            self.pair_ids.extend(array('l', [0]) * len(table))
+        self.dates.extend(table.dates)
+        self.amounts.extend(table.amounts)
+        self.values.extend(table.values)
+        self.currency_codes.extend(array('H', [codes[code] for code in table.currency_codes]))
+        self.type_codes.extend(table.type_codes)
+
+    def reverse(self):
+        for column in self.get_row_columns():
+            column.reverse()
+
+    def sort_by_date(self):
+        self.reorder(sorted(xrange(len(self)), key=self.dates.__getitem__))
+
+    def reorder(self, indexes):
+        for column in self.get_row_columns():
+            column[:] = array(column.typecode, [column[index] for index in indexes])
+
+    # the columns saved to binary files
+    def get_columns(self):
+        return [self.dates, self.amounts, self.values, self.currency_codes, self.type_codes]
+
+    # every per row column, including the pair ids if there are any
+    def get_row_columns(self):
+        return self.get_columns() + ([self.pair_ids] if self.pair_ids is not None else [])
+
+    # Transaction.is_taxable over the whole table at once
+    def get_taxable_mask(self):
+        return array('b', [amount <= 0 or type_code == FEE_TYPE_CODE
+                           for amount, type_code in izip(self.amounts, self.type_codes)])
+
+    def filter(self, mask):
+        table = TransactionTable()
+        table.currencies = list(self.currencies)
+        table.currency_to_code = dict(self.currency_to_code)
+        if self.pair_ids is not None:
+            table.pair_ids = array('l')
+            table.next_pair_id = self.next_pair_id
+        for column, table_column in zip(self.get_row_columns(), table.get_row_columns()):
+            table_column.extend(compress(column, mask))
+        return table
+
+
+class TransactionRow(object):
+    """
+    View of one row of a TransactionTable with the same interface as Transaction. Setting amount or value writes
+    through to the table.
+    """
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def date(self):
+        return EPOCH + timedelta(seconds=self.table.dates[self.index])
+
+    @property
+    def transaction_type(self):
+        return Transaction.VALID_TRANSACTION_TYPES[self.table.type_codes[self.index]]
+
+    @property
+    def currency(self):
+        return self.table.currencies[self.table.currency_codes[self.index]]
+
+    @property
+    def amount(self):
+        return from_units(self.table.amounts[self.index])
+
+    @amount.setter
+    def amount(self, amount):
+        self.table.amounts[self.index] = to_units(amount)
+
+    @property
+    def pair_id(self):
+        return self.table.pair_ids[self.index] if self.table.pair_ids is not None else 0
+
+    @property
+    def units(self):
+        return int(self.table.amounts[self.index])
+
+    @property
+    def value(self):
+        value = self.table.values[self.index]
+        return '' if value != value else value
+
+    @value.setter
+    def value(self, value):
+        self.table.values[self.index] = to_stored_value(value)
+
+    def is_taxable(self):
+        return self.units <= 0 or self.table.type_codes[self.index] == FEE_TYPE_CODE
+
+    def is_fee(self):
+        return self.table.type_codes[self.index] == FEE_TYPE_CODE
+
+    def get_coinbase_date(self):
+        return datetime.strftime(self.date, "%Y-%m-%d")
+
+    def get_row(self):
+        return [self.date, self.transaction_type, self.currency, to_exact_amount(self.units), self.value]
+
+    # see Transaction.with_units, the copy is a Transaction since it is not part of the table
+    def with_units(self, units):
+        return Transaction.from_units(self.date, self.transaction_type, self.currency, units, self.value)
+
+
+def to_timestamp(date):
+    delta = date - EPOCH
+    return delta.days * 86400 + delta.seconds
+
+
+def to_stored_value(value):
+    return abs(float(value)) if value != '' and value is not None else NAN
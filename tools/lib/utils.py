@@ -1,5 +1,25 @@
+import threading
+import time
+
+
 def find(li, ele):
     try:
         return li.index(ele)
     except ValueError:
         return False
+
+
+# spaces calls evenly so that no more than calls_per_second are started, shared safely between threads
+class RateLimiter:
+    def __init__(self, calls_per_second):
+        self.interval = 1.0 / calls_per_second if calls_per_second else 0
+        self.next_call_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            delay = self.next_call_time - now
+            self.next_call_time = max(now, self.next_call_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
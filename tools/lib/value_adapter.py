@@ -1,19 +1,153 @@
-import coinbase_api
+from cross_rates import FIXED_USD_PRICES, PriceIndex, find_pair_trades
+from price_cache import PriceCache
+from price_providers import CoinbasePriceProvider, PriceProviderChain
+
+import collections
+
 
 class ValueAdapter:
-    def __init__(self):
-        self.currency_values_cache = dict()
+    DEFAULT_PREFETCH_WORKERS = 8
+
+    # cross_rates values one side of a pair trade from the other, see set_cross_rate_values
+    # price_providers are the sources prices missing from the cache are looked up in, coinbase when not given
+    def __init__(self, price_cache=None, coinbase_client=None, cross_rates=True, price_providers=None):
+        self.currency_values_cache = price_cache if price_cache is not None else PriceCache()
+        if price_providers is None:
+            price_providers = [CoinbasePriceProvider(coinbase_client)]
+        self.price_providers = PriceProviderChain(price_providers)
+        self.cross_rates = cross_rates
+        # lookups no provider had a price for in this run, they are not asked for again until the next run
+        self.unresolved_hashes = set()
+        # values derived from pair trades and fetched from providers, see get_metrics
+        self.cross_rate_values = 0
+        self.fetched_values = 0
 
     @staticmethod
     def get_currency_values_hash(transaction):
         return transaction.get_coinbase_date(), transaction.currency
 
+    def set_transaction_values(self, transactions, max_workers=DEFAULT_PREFETCH_WORKERS):
+        if self.cross_rates:
+            self.set_cross_rate_values(transactions, max_workers)
+        self.prefetch_currency_values(transactions, max_workers)
+        for transaction in transactions:
+            self.set_transaction_value(transaction)
+
+    # values both sides of a pair trade once either side has a price, so one lookup covers the pair and coins coinbase
+    # has no price for are valued through the coin they were traded against. Transactions in currencies without a
+    # coinbase price then take the latest price derived for their currency.
+    def set_cross_rate_values(self, transactions, max_workers=DEFAULT_PREFETCH_WORKERS):
+        pairs = find_pair_trades(transactions)
+        pairs.sort(key=lambda pair: pair[0].date)
+
+        # only the side a pair is anchored on is looked up
+        anchors = list()
+        for pair in pairs:
+            if pair[0].value or pair[1].value or any(leg.currency in FIXED_USD_PRICES for leg in pair):
+                continue
+            for leg in pair:
+                if self.price_providers.can_price(leg.currency):
+                    anchors.append(leg)
+                    break
+        self.prefetch_currency_values(anchors, max_workers)
+
+        price_index = PriceIndex()
+        for pair in pairs:
+            anchor = self.get_anchor_price(pair, price_index)
+            if anchor is None:
+                continue
+            leg, price = anchor
+            other = pair[1] if leg is pair[0] else pair[0]
+            if not leg.value:
+                leg.value = price
+            if not other.value:
+                other.value = price * abs(leg.amount / other.amount)
+                self.cross_rate_values += 1
+            price_index.add(leg.currency, leg.date, leg.value)
+            price_index.add(other.currency, other.date, other.value)
+
+        for transaction in transactions:
+            if not transaction.value and not self.price_providers.can_price(transaction.currency):
+                price = FIXED_USD_PRICES.get(transaction.currency) or price_index.get(transaction.currency,
+                                                                                      transaction.date)
+                if price:
+                    transaction.value = price
+                    self.cross_rate_values += 1
+
+    # (leg, US dollar price) of the side of a pair whose price is known, preferring prices that are not derived
+    def get_anchor_price(self, pair, price_index):
+        for leg in pair:
+            if leg.value:
+                return leg, leg.value
+        for leg in pair:
+            if leg.currency in FIXED_USD_PRICES:
+                return leg, FIXED_USD_PRICES[leg.currency]
+        for leg in pair:
+            if self.price_providers.can_price(leg.currency):
+                price = self.get_currency_value(leg)
+                if price != PriceCache.UNAVAILABLE:
+                    return leg, price
+        for leg in pair:
+            price = price_index.get(leg.currency, leg.date)
+            if price is not None:
+                return leg, price
+        return None
+
     def set_transaction_value(self, transaction):
         if not transaction.value:
-            if self.get_currency_values_hash(transaction) not in self.currency_values_cache:
-                if coinbase_api.is_coinbase_price_available(transaction.currency):
-                    self.currency_values_cache[self.get_currency_values_hash(transaction)] = \
-                        float(coinbase_api.get_historic_price(transaction.currency, transaction.get_coinbase_date()))
-                else: # cannot find price of currency
-                    self.currency_values_cache[self.get_currency_values_hash(transaction)] = ''
-            transaction.value = self.currency_values_cache[self.get_currency_values_hash(transaction)]
+            transaction.value = self.get_currency_value(transaction)
+
+    # a price cached as UNAVAILABLE is still looked up in the providers other than the one it was missing from, for
+    # example in a price file added since
+    def get_currency_value(self, transaction):
+        currency_values_hash = self.get_currency_values_hash(transaction)
+        if currency_values_hash in self.unresolved_hashes:
+            return PriceCache.UNAVAILABLE
+        value, source = self.currency_values_cache.get_with_source(currency_values_hash)
+        if value is None or value == PriceCache.UNAVAILABLE:
+            self.fetch_currency_values([currency_values_hash], 1, source)
+            value = self.currency_values_cache.get(currency_values_hash)
+        return value if value is not None else PriceCache.UNAVAILABLE
+
+    # resolves every price the transactions are missing up front, fetching them concurrently
+    def prefetch_currency_values(self, transactions, max_workers=DEFAULT_PREFETCH_WORKERS):
+        seen_hashes = set()
+        # provider the price was found missing from, if any, to the lookups
+        missing_hashes = collections.defaultdict(list)
+        for transaction in transactions:
+            if transaction.value:
+                continue
+            currency_values_hash = self.get_currency_values_hash(transaction)
+            if currency_values_hash in seen_hashes or currency_values_hash in self.unresolved_hashes:
+                continue
+            seen_hashes.add(currency_values_hash)
+            value, source = self.currency_values_cache.get_with_source(currency_values_hash)
+            if value is None or value == PriceCache.UNAVAILABLE:
+                missing_hashes[source].append(currency_values_hash)
+
+        for source, currency_values_hashes in sorted(missing_hashes.items()):
+            self.fetch_currency_values(sorted(currency_values_hashes), max_workers, source)
+
+    # looks up prices through the provider chain except the provider named excluded, only this thread ever touches
+    # the cache. Each price is cached as it arrives, so prices found before a failing lookup are kept. A price still
+    # missing keeps the UNAVAILABLE entry it had unless another provider found it missing.
+    def fetch_currency_values(self, currency_values_hashes, max_workers, excluded=None):
+        priced_hashes = set()
+        for currency_values_hash, price, source in self.price_providers.get_prices(currency_values_hashes, max_workers,
+                                                                                   excluded):
+            if price is None:
+                self.currency_values_cache.set(currency_values_hash, PriceCache.UNAVAILABLE, source)
+                continue
+            self.currency_values_cache.set(currency_values_hash, price)
+            self.fetched_values += 1
+            priced_hashes.add(currency_values_hash)
+        self.unresolved_hashes.update(currency_values_hash for currency_values_hash in currency_values_hashes
+                                      if currency_values_hash not in priced_hashes)
+
+    def get_metrics(self):
+        return {
+            "price_cache": self.currency_values_cache.get_stats(),
+            "cross_rate_values": self.cross_rate_values,
+            "fetched_values": self.fetched_values,
+            "price_providers": dict(self.price_providers.answered),
+        }
@@ -0,0 +1,92 @@
+from lib.holdings_index import HoldingsIndex
+from lib.price_cache import PriceCache
+from lib.price_providers import PriceFileProvider
+
+import argparse
+import csv
+import datetime
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Look up the open lots and cost basis at a date from the holdings '
+                                                 'index saved by generate_tax_report.py')
+    parser.add_argument('--holdings_index',
+                        required=True,
+                        help="Location of the index saved with --holdings_index")
+    parser.add_argument('--date',
+                        required=True,
+                        type=parse_date,
+                        help="yyyy-mm-dd for the end of that day or yyyy-mm-dd hh:mm:ss")
+    parser.add_argument('--currency',
+                        type=str.lower,
+                        help="only look up this currency")
+    parser.add_argument('--lots',
+                        action='store_true',
+                        help="also print every open lot")
+    parser.add_argument('--price_cache',
+                        help="price cache to take the price at --date from for the unrealized gain")
+    parser.add_argument('--price_file',
+                        help="Date,Currency,Price csv to take the price at --date from for the unrealized gain")
+    parser.add_argument('--export_file',
+                        help="path to save one row per currency to")
+    return parser.parse_args()
+
+
+def parse_date(date):
+    try:
+        return datetime.datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return datetime.datetime.strptime(date, "%Y-%m-%d") + datetime.timedelta(days=1, seconds=-1)
+
+
+def run():
+    args = parse_arguments()
+    holdings_index = HoldingsIndex(args.holdings_index)
+    lots = holdings_index.get_lots(args.date, args.currency)
+    holdings = holdings_index.get_holdings(args.date, args.currency)
+    holdings_index.close()
+
+    prices = get_prices(args, sorted(holdings))
+    rows = list()
+    for currency in sorted(holdings):
+        amount, cost_basis, open_lots = holdings[currency]
+        price = prices.get(currency)
+        market_value = amount * price if price is not None else ''
+        unrealized_gain = market_value - cost_basis if price is not None else ''
+        rows.append([currency, amount, cost_basis, price if price is not None else '', market_value, unrealized_gain,
+                     open_lots])
+
+    header = ["Currency", "Amount", "Cost basis", "Price", "Market value", "Unrealized gain", "Open lots"]
+    print(" | ".join(header))
+    for row in rows:
+        print(" | ".join(str(field) for field in row))
+        if args.lots:
+            for date, amount, value in lots[row[0]]:
+                print("    %s %r at %r" % (date, amount, value))
+
+    if args.export_file:
+        with open(args.export_file, 'wb') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+# currency to price on the day of --date, from the price file first
+def get_prices(args, currencies):
+    lookups = [(args.date.strftime("%Y-%m-%d"), currency) for currency in currencies]
+    prices = dict()
+    if args.price_cache:
+        price_cache = PriceCache(args.price_cache)
+        for lookup in lookups:
+            price = price_cache.get(lookup)
+            if price is not None and price != PriceCache.UNAVAILABLE:
+                prices[lookup[1]] = price
+        price_cache.close()
+    if args.price_file:
+        for (_, currency), price in PriceFileProvider(args.price_file).get_prices(lookups).items():
+            prices[currency] = price
+    return prices
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,35 @@
+from lib.disposals import DisposalRecords
+
+import argparse
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Summarize the disposals saved by generate_tax_report.py')
+    parser.add_argument('--input_file',
+                        required=True,
+                        help="Location of the disposals saved with --disposals_file")
+    parser.add_argument('--form_8949_file',
+                        help="path to save one row per lot sold to, laid out like IRS form 8949")
+    return parser.parse_args()
+
+
+def run():
+    args = parse_arguments()
+    disposals = DisposalRecords.read_from_file(args.input_file)
+
+    short_term_proceeds, short_term_cost_basis, long_term_proceeds, long_term_cost_basis, fees = \
+        disposals.summarize()
+    print("Short term proceeds: %r" % short_term_proceeds)
+    print("Short term cost basis: %r" % short_term_cost_basis)
+    print("Short term capital gains: %r" % (short_term_proceeds - short_term_cost_basis))
+    print("Long term proceeds: %r" % long_term_proceeds)
+    print("Long term cost basis: %r" % long_term_cost_basis)
+    print("Long term capital gains: %r" % (long_term_proceeds - long_term_cost_basis))
+    print("Fees paid: %r" % fees)
+
+    if args.form_8949_file:
+        disposals.write_form_8949(args.form_8949_file)
+
+
+if __name__ == '__main__':
+    run()
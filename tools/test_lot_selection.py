@@ -0,0 +1,26 @@
+from lib.lot_selection import SpecificIdentificationLotSelector
+from lib.transaction import Transaction
+from datetime import datetime
+
+import unittest
+
+
+class SpecificIdentificationLotSelectorTest(unittest.TestCase):
+    def test_partly_sold_designated_lot_keeps_its_place(self):
+        january, february, march, april = [datetime(2018, month, 1) for month in (1, 2, 3, 4)]
+        lot_selector = SpecificIdentificationLotSelector({(march, "btc"): [february]})
+        lot_selector.push(Transaction(january, "trade", "btc", 1, 100))
+        lot_selector.push(Transaction(february, "trade", "btc", 1, 200))
+
+        lot = lot_selector.pop(Transaction(march, "trade", "btc", -0.5, 150))
+        self.assertEqual(lot.date, february)
+        lot_selector.restore(lot.with_units(lot.units // 2))
+
+        # the sale without a designation takes the oldest lot, not the partly sold one
+        self.assertEqual(lot_selector.pop(Transaction(april, "trade", "btc", -0.5, 150)).date, january)
+        self.assertEqual(sorted(lot_selector.order), [1])
+        self.assertEqual([lot.date for lot in lot_selector.get_lots()], [february])
+
+
+if __name__ == '__main__':
+    unittest.main()